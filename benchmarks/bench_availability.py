@@ -0,0 +1,133 @@
+"""
+Benchmark the one-pass availability engine against the original per-sensor loop of
+create_sensor_issue_table, on synthetic data with 10x the current number of stations.
+
+Run from the repository root:
+    python -m benchmarks.bench_availability
+"""
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import polars as pl
+from src.availability import create_availability_table
+
+N_STATIONS = 10 * 34     # 10x the current check table
+N_VARIABLES = 25
+N_DAYS = 2               # of 1-minute data
+REPEATS = 3
+
+def make_dataset(rng):
+    """Check table, sensorinfo and wide data with a mix of OK, ND, NF, N/A and 30-min sensors."""
+    var_names = [f"VAR{v:02d}" for v in range(N_VARIABLES)]
+    stations = [f"ST{s:03d}" for s in range(N_STATIONS)]
+    datetimes = pl.datetime_range(
+        datetime(2025, 7, 1), datetime(2025, 7, 1 + N_DAYS), '1m', closed='left', eager=True, time_zone='UTC'
+    )
+    n_rows = len(datetimes)
+    half_hour = (datetimes.dt.minute().to_numpy() % 30) == 0
+
+    check_rows, sensorinfo_rows, columns = [], [], {'datetime': datetimes}
+    half_hour_ids = set()
+    sensor_id = 0
+    for station in stations:
+        row = {'station': station, 'source': 'wur_db'}
+        for var in var_names:
+            kind = rng.choice(['ok', 'ok', 'ok', '30min', 'nd', 'nf', 'na'])
+            if kind == 'na':
+                row[var] = np.nan
+                continue
+            sensor_id += 1
+            row[var] = f"{var}_{station}"
+            if kind == 'nf':
+                continue
+            sensorinfo_rows.append({'sensor_id': sensor_id, 'sensor_name': row[var], 'site_name': station})
+            values = rng.normal(10, 2, n_rows)
+            if kind == 'nd':
+                values[:] = np.nan
+            elif kind == '30min':
+                values[~half_hour] = np.nan
+                half_hour_ids.add(str(sensor_id))
+            values[rng.random(n_rows) < 0.05] = np.nan
+            columns[str(sensor_id)] = values
+        check_rows.append(row)
+
+    check_table = pd.DataFrame(check_rows, columns=['station', 'source'] + var_names)
+    sensorinfo_df = pl.DataFrame(sensorinfo_rows)
+    data_df = pl.DataFrame(columns).fill_nan(None)
+    return data_df, sensorinfo_df, check_table, half_hour_ids
+
+def reference_sensor_issue_table(data_df, sensorinfo_df, check_table):
+    """
+    The original implementation: separate Polars queries per station and variable.
+    It divides by all rows for 30-min sensors as well, which the engine no longer does.
+    """
+    total_rows = len(data_df)
+    results = []
+    for _, row in check_table.iterrows():
+        station = row['station']
+        sensorinfo_df_station = sensorinfo_df.filter(pl.col('site_name') == station)
+        sensor_name_to_id = {}
+        for sensor_row in sensorinfo_df_station.iter_rows(named=True):
+            sensor_name_to_id[sensor_row['sensor_name']] = str(sensor_row['sensor_id'])
+        for var_name in check_table.columns[2:]:
+            sensor_name = row[var_name]
+            if pd.isna(sensor_name) or sensor_name == '':
+                data_availability = 0.0
+                actual_sensor_id = ''
+                reason = 'N/A'
+            else:
+                actual_sensor_id = sensor_name_to_id.get(sensor_name, '')
+                if actual_sensor_id in data_df.columns:
+                    sensor_data = data_df.select([pl.col("datetime"), pl.col(actual_sensor_id)])
+                    non_null_data = sensor_data.filter(pl.col(actual_sensor_id).is_not_null())
+                    if non_null_data.height == 0:
+                        data_availability = 0.0
+                        reason = 'ND'
+                    else:
+                        is_30min = non_null_data["datetime"].dt.minute().is_in([0, 30]).all()
+                        if is_30min:
+                            expected = sensor_data.filter(pl.col("datetime").dt.minute().is_in([0, 30]))
+                            nan_count = expected.select(pl.col(actual_sensor_id).is_null()).sum().item()
+                        else:
+                            nan_count = sensor_data.select(pl.col(actual_sensor_id).is_null()).sum().item()
+                        data_availability = ((total_rows - nan_count) / total_rows) * 100
+                        reason = 'OK'
+                else:
+                    data_availability = 0.0
+                    reason = 'NF'
+            results.append({
+                'Station': station,
+                'Variable': var_name,
+                'Sensor_Name': sensor_name if not pd.isna(sensor_name) else '',
+                'Sensor_ID': actual_sensor_id,
+                'NaN_Percentage': round(data_availability, 1),
+                'Reason': reason,
+            })
+    return pd.DataFrame(results)
+
+def timeit(func, *args):
+    timings = []
+    for _ in range(REPEATS):
+        t0 = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - t0)
+    return min(timings), result
+
+if __name__ == '__main__':
+    data_df, sensorinfo_df, check_table, half_hour_ids = make_dataset(np.random.default_rng(0))
+
+    t_loop, table_loop = timeit(reference_sensor_issue_table, data_df, sensorinfo_df, check_table)
+    t_vec, table_vec = timeit(create_availability_table, data_df, sensorinfo_df, check_table)
+
+    # Same table, except that 30-min sensors are now counted on their own slots
+    half_hour = table_vec['Sensor_ID'].isin(half_hour_ids) & (table_vec['Reason'] == 'OK')
+    pd.testing.assert_frame_equal(table_loop[~half_hour], table_vec[~half_hour], check_dtype=False)
+    half_hour_ids = table_vec.loc[half_hour, 'Sensor_ID'].tolist()
+    expected = data_df.select(pl.col(half_hour_ids).count() / (data_df.height // 30) * 100).row(0)
+    assert np.allclose(table_vec.loc[half_hour, 'NaN_Percentage'], expected, atol=0.05)
+
+    print(f"Stations: {N_STATIONS}, variables: {N_VARIABLES}, sensor columns: {len(data_df.columns) - 1}, rows: {data_df.height}")
+    print(f"Per-sensor loop: {t_loop * 1000:9.1f} ms")
+    print(f"One pass:        {t_vec * 1000:9.1f} ms")
+    print(f"Speedup: {t_loop / t_vec:.1f}x")
@@ -0,0 +1,114 @@
+"""
+Benchmark the batch air pressure corrections against the original per-sensor loops of
+find_incorrect_airpressure_sensors and correct_airpressure_units, with hundreds of PAIR sensors.
+
+Run from the repository root:
+    python -m benchmarks.bench_corrections
+"""
+import time
+from datetime import datetime
+import numpy as np
+import polars as pl
+from src.corrections import correct_airpressure_units, find_incorrect_airpressure_sensors
+
+N_PAIR_SENSORS = 500
+N_OTHER_SENSORS = 500
+N_DAYS = 2               # of 1-minute data
+REPEATS = 3
+
+def make_dataset(rng):
+    """Sensorinfo and wide data with PAIR sensors in hPa, in kPa (factor 10 too low) or with a wrong unit."""
+    datetimes = pl.datetime_range(
+        datetime(2025, 7, 1), datetime(2025, 7, 1 + N_DAYS), '1m', closed='left', eager=True, time_zone='UTC'
+    )
+    n_rows = len(datetimes)
+
+    sensorinfo_rows, columns = [], {'datetime': datetimes}
+    for sensor_id in range(1, N_PAIR_SENSORS + N_OTHER_SENSORS + 1):
+        if sensor_id <= N_PAIR_SENSORS:
+            kind = rng.choice(['hPa', 'hPa', 'kPa', 'unit', 'empty'])
+            values = rng.normal(1013, 5, n_rows)
+            if kind == 'kPa':
+                values /= 10
+            elif kind == 'empty':
+                values[:] = np.nan
+            unit = 'mbar' if kind == 'unit' else 'hPa'
+            sensorinfo_rows.append({'sensor_id': sensor_id, 'variable_name': f'PAIR_{sensor_id % 3}', 'unit': unit})
+        else:
+            values = rng.normal(10, 2, n_rows)
+            sensorinfo_rows.append({'sensor_id': sensor_id, 'variable_name': 'TA', 'unit': 'degC'})
+        values[rng.random(n_rows) < 0.05] = np.nan
+        columns[str(sensor_id)] = values
+
+    sensorinfo_df = pl.DataFrame(sensorinfo_rows)
+    data_df = pl.DataFrame(columns).fill_nan(None)
+    return data_df, sensorinfo_df
+
+def reference_find_incorrect_airpressure_sensors(sensorinfo_df, data_df, threshold=200):
+    """The original implementation: one column extraction and sensorinfo filter per PAIR sensor."""
+    airpressure_sensors = sensorinfo_df.filter(
+        pl.col('variable_name').str.contains('PAIR')
+    )['sensor_id'].to_list()
+
+    incorrect_sensors = []
+    for sensor in airpressure_sensors:
+        sensor_str = str(sensor)
+        if sensor_str in data_df.columns:
+            vals = data_df.select(sensor_str).to_series().drop_nulls()
+            sensor_info = sensorinfo_df.filter(pl.col('sensor_id') == sensor)
+            if sensor_info.height > 0 and 'unit' in sensorinfo_df.columns:
+                unit = sensor_info['unit'].item()
+            else:
+                unit = 'hPa'
+            if (vals.len() > 0 and vals.median() < threshold) or (unit not in ['hPa', 'hpa']):
+                incorrect_sensors.append(sensor)
+    return incorrect_sensors
+
+def reference_correct_airpressure_units(data_df, sensorinfo_df, sensor_ids):
+    """The original implementation: one with_columns on both frames per sensor."""
+    for sensor in sensor_ids:
+        sensor_str = str(sensor)
+        if sensor_str in data_df.columns:
+            data_df = data_df.with_columns([
+                (pl.col(sensor_str) * 10).alias(sensor_str)
+            ])
+        if 'unit' in sensorinfo_df.columns:
+            sensorinfo_df = sensorinfo_df.with_columns([
+                pl.when(pl.col('sensor_id') == sensor)
+                .then(pl.lit('hPa'))
+                .otherwise(pl.col('unit'))
+                .alias('unit')
+            ])
+    return data_df, sensorinfo_df
+
+def reference_pipeline(data_df, sensorinfo_df):
+    incorrect_sensors = reference_find_incorrect_airpressure_sensors(sensorinfo_df, data_df)
+    return incorrect_sensors, *reference_correct_airpressure_units(data_df, sensorinfo_df, incorrect_sensors)
+
+def batch_pipeline(data_df, sensorinfo_df):
+    incorrect_sensors = find_incorrect_airpressure_sensors(sensorinfo_df, data_df)
+    return incorrect_sensors, *correct_airpressure_units(data_df, sensorinfo_df, incorrect_sensors)
+
+def timeit(func, *args):
+    timings = []
+    for _ in range(REPEATS):
+        t0 = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - t0)
+    return min(timings), result
+
+if __name__ == '__main__':
+    data_df, sensorinfo_df = make_dataset(np.random.default_rng(0))
+
+    t_loop, (sensors_loop, data_loop, info_loop) = timeit(reference_pipeline, data_df, sensorinfo_df)
+    t_batch, (sensors_batch, data_batch, info_batch) = timeit(batch_pipeline, data_df, sensorinfo_df)
+
+    assert sensors_loop == sensors_batch
+    assert data_loop.equals(data_batch)
+    assert info_loop.equals(info_batch)
+
+    print(f"PAIR sensors: {N_PAIR_SENSORS}, other sensors: {N_OTHER_SENSORS}, rows: {data_df.height}")
+    print(f"Incorrect sensors: {len(sensors_batch)}")
+    print(f"Per-sensor loop: {t_loop * 1000:9.1f} ms")
+    print(f"Batch:           {t_batch * 1000:9.1f} ms")
+    print(f"Speedup: {t_loop / t_batch:.1f}x")
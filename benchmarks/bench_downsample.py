@@ -0,0 +1,129 @@
+"""
+Benchmark the downsampled multi-sensor timeline against sending every raw point, for a
+week of 1-minute data: figure JSON size (the browser payload) and build + serialise time.
+The browser render time is not measured here. Plotly draws every point of a line and one
+SVG node per marker, so the benchmark holds the figure to a budget of drawn points and
+marker nodes (RENDER_REDUCTION) instead.
+
+Run from the repository root:
+    python -m benchmarks.bench_downsample
+"""
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import polars as pl
+from src.downsample import downsample
+from polars.testing import assert_frame_equal
+from src.pyramid import compute_pyramid, get_trace_data, update_pyramid
+from src.timeline_plot import create_multi_timeline_plot
+
+N_SENSORS = 10
+N_DAYS = 7               # of 1-minute data
+GRAPH_WIDTH = 1200
+REPEATS = 3
+# Minimum reduction of the payload and of the drawn points and marker nodes
+RENDER_REDUCTION = 10
+
+def make_dataset(rng):
+    """Wide data with spikes and a gap per sensor, and the tables the plot looks the sensors up in."""
+    datetimes = pl.datetime_range(
+        datetime(2025, 7, 1), datetime(2025, 7, 1 + N_DAYS), '1m', closed='left', eager=True, time_zone='UTC'
+    )
+    n_rows = len(datetimes)
+    columns = {'datetime': datetimes}
+    for sensor_id in range(1, N_SENSORS + 1):
+        values = 10 + np.sin(np.arange(n_rows) / 720) + rng.normal(0, 0.2, n_rows)
+        values[rng.integers(0, n_rows, 3)] += rng.choice([-20, 20], 3)
+        gap_start = rng.integers(0, n_rows - 600)
+        values[gap_start:gap_start + 600] = np.nan
+        columns[str(sensor_id)] = values
+    data_df = pl.DataFrame(columns).fill_nan(None)
+
+    stations = [f"ST{s:02d}" for s in range(1, N_SENSORS + 1)]
+    check_table = pd.DataFrame({'station': stations, 'source': 'wur_db', 'TA': [f"TA_{s}" for s in stations]})
+    nan_table = pd.DataFrame({
+        'Station': stations, 'Variable': 'TA', 'Sensor_ID': [str(i) for i in range(1, N_SENSORS + 1)]
+    })
+    selected_cells = [{'station': station, 'variable': 'TA'} for station in stations]
+    return data_df, check_table, nan_table, selected_cells
+
+def reference_multi_timeline(data_df, nan_table):
+    """The original traces: every non-null point, as lines and markers, with the same layout."""
+    fig = go.Figure()
+    for sensor_id in nan_table['Sensor_ID']:
+        plot_data = data_df.select(['datetime', sensor_id]).to_pandas().dropna(subset=[sensor_id])
+        fig.add_trace(go.Scatter(x=plot_data['datetime'], y=plot_data[sensor_id], mode='lines+markers'))
+    fig.update_layout(template='plotly_white', hovermode='x unified', xaxis=dict(rangeslider=dict(visible=True), type='date'))
+    return fig
+
+def count_drawn(fig):
+    """Points of the lines and marker nodes the browser draws for a figure."""
+    points = sum(len(trace.x) for trace in fig.data)
+    markers = sum(len(trace.x) for trace in fig.data if 'markers' in (trace.mode or ''))
+    return points, markers
+
+def timeit(func, *args, **kwargs):
+    timings = []
+    for _ in range(REPEATS):
+        t0 = time.perf_counter()
+        payload = func(*args, **kwargs).to_json()
+        timings.append(time.perf_counter() - t0)
+    return min(timings), payload
+
+if __name__ == '__main__':
+    data_df, check_table, nan_table, selected_cells = make_dataset(np.random.default_rng(0))
+
+    t_raw, payload_raw = timeit(reference_multi_timeline, data_df, nan_table)
+    t_down, payload_down = timeit(
+        create_multi_timeline_plot, data_df, selected_cells, check_table, nan_table, width=GRAPH_WIDTH
+    )
+
+    # Budget for the browser: the payload and the drawn points and marker nodes shrink 10x
+    points_raw, markers_raw = count_drawn(reference_multi_timeline(data_df, nan_table))
+    points_down, markers_down = count_drawn(
+        create_multi_timeline_plot(data_df, selected_cells, check_table, nan_table, width=GRAPH_WIDTH)
+    )
+    assert len(payload_raw) >= RENDER_REDUCTION * len(payload_down)
+    assert points_raw + markers_raw >= RENDER_REDUCTION * (points_down + markers_down)
+
+    # Every spike and every gap survives the downsampling
+    for sensor_id in nan_table['Sensor_ID']:
+        values = data_df[sensor_id].to_numpy()
+        x, y = downsample(data_df['datetime'].to_numpy(), values, GRAPH_WIDTH)
+        assert np.nanmax(y) == np.nanmax(values) and np.nanmin(y) == np.nanmin(values)
+        assert np.isnan(y).sum() == 1
+
+    # The min/max envelope of the pyramid only breaks at real gaps, also for data covering
+    # half of the window, where the envelope is not reduced any further
+    filled_df = data_df.fill_null(strategy='forward').fill_null(strategy='backward')
+    pyramid, filled_pyramid = compute_pyramid(data_df), compute_pyramid(filled_df)
+    start_dt = data_df['datetime'].min() - timedelta(days=N_DAYS)
+    end_dt = data_df['datetime'].max()
+    for width in [GRAPH_WIDTH, 2 * GRAPH_WIDTH]:
+        traces = get_trace_data(data_df, nan_table['Sensor_ID'], start_dt, end_dt, width=width, pyramid=pyramid)
+        assert all(np.isnan(y).sum() == 1 for _, y, _ in traces.values())
+        traces = get_trace_data(filled_df, nan_table['Sensor_ID'], start_dt, end_dt, width=width, pyramid=filled_pyramid)
+        assert all(not np.isnan(y).any() for _, y, _ in traces.values())
+
+    # Sliding the window by a day and a half: the updated pyramid equals a rebuild
+    old_end = data_df['datetime'].max() - timedelta(hours=36)
+    old_pyramid = compute_pyramid(data_df.filter(pl.col('datetime') <= old_end))
+    new_start = data_df['datetime'].min() + timedelta(hours=36)
+    new_df = data_df.filter(pl.col('datetime') >= new_start)
+    t0 = time.perf_counter()
+    updated = update_pyramid(old_pyramid, new_df, new_start, end_dt)
+    t_update = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    rebuilt = compute_pyramid(new_df)
+    t_rebuild = time.perf_counter() - t0
+    assert_frame_equal(updated, rebuilt, check_exact=False, rtol=1e-12)
+
+    print(f"Sensors: {N_SENSORS}, rows: {data_df.height}, graph width: {GRAPH_WIDTH} px")
+    print(f"Raw points:  {len(payload_raw) / 1e6:8.2f} MB JSON, {t_raw * 1000:8.1f} ms")
+    print(f"Downsampled: {len(payload_down) / 1e6:8.2f} MB JSON, {t_down * 1000:8.1f} ms")
+    print(f"Payload reduction: {len(payload_raw) / len(payload_down):.1f}x, speedup: {t_raw / t_down:.1f}x")
+    print(f"Drawn: {points_raw} points + {markers_raw} markers -> {points_down} points + {markers_down} markers, "
+          f"{(points_raw + markers_raw) / (points_down + markers_down):.1f}x fewer")
+    print(f"Pyramid after a window slide: rebuild {t_rebuild * 1000:.1f} ms, update {t_update * 1000:.1f} ms")
@@ -0,0 +1,69 @@
+"""
+Benchmark the client-side dedup (unique + pivot in Polars) against the server-side
+DISTINCT ON path of build_data_query, on a synthetic stand-in of cdr.pointdata in DuckDB.
+
+Run from the repository root:
+    python -m benchmarks.bench_server_dedup
+"""
+import time
+from datetime import datetime, timedelta
+import duckdb
+import numpy as np
+import polars as pl
+from src.db import build_data_query
+
+N_SENSORS = 34 * 25      # stations x variables
+N_MINUTES = 6 * 60       # one 6 hour chunk of 1-minute data
+DUPLICATION = 3          # every (dt, logicid) row is stored this many times
+REPEATS = 5
+
+def make_pointdata(con):
+    """Create cdr.pointdata with N_SENSORS sensors of 1-minute data, every row duplicated."""
+    start = datetime(2025, 7, 1)
+    dts = np.array([start + timedelta(minutes=m) for m in range(N_MINUTES)], dtype='datetime64[us]')
+    dt = np.tile(np.repeat(dts, N_SENSORS), DUPLICATION)
+    logicid = np.tile(np.arange(1, N_SENSORS + 1), N_MINUTES * DUPLICATION)
+    value = np.random.default_rng(0).normal(10, 2, dt.size)
+    pointdata = pl.DataFrame({'dt': dt, 'logicid': logicid, 'value': value})
+
+    con.execute("CREATE SCHEMA cdr")
+    con.execute("CREATE TABLE cdr.pointdata AS SELECT * FROM pointdata")
+    return start, start + timedelta(minutes=N_MINUTES)
+
+def client_path(con, query):
+    data = con.execute(query).pl()
+    data = data.unique(subset=['dt', 'logicid'])
+    return data.height, data.pivot(index='dt', columns='logicid', values='value')
+
+def server_path(con, query):
+    data = con.execute(query).pl()
+    return data.height, data.pivot(index='dt', columns='logicid', values='value')
+
+def timeit(func, *args):
+    timings = []
+    for _ in range(REPEATS):
+        t0 = time.perf_counter()
+        rows, result = func(*args)
+        timings.append(time.perf_counter() - t0)
+    return min(timings), rows, result
+
+if __name__ == '__main__':
+    con = duckdb.connect()
+    start_dt, end_dt = make_pointdata(con)
+    sensorids = list(range(1, N_SENSORS + 1))
+
+    query_client = build_data_query('vu_db', sensorids, start_dt, end_dt)
+    query_server = build_data_query('vu_db', sensorids, start_dt, end_dt, server_dedup=True)
+
+    # Rows transferred before any dedup
+    raw_rows = con.execute(query_client).pl().height
+
+    t_client, _, df_client = timeit(client_path, con, query_client)
+    t_server, rows_server, df_server = timeit(server_path, con, query_server)
+
+    assert df_client.shape == df_server.shape
+
+    print(f"Sensors: {N_SENSORS}, minutes: {N_MINUTES}, duplication: {DUPLICATION}")
+    print(f"Client dedup: {raw_rows:>9} rows transferred, {t_client * 1000:8.1f} ms")
+    print(f"Server dedup: {rows_server:>9} rows transferred, {t_server * 1000:8.1f} ms")
+    print(f"Speedup: {t_client / t_server:.2f}x, rows transferred: {raw_rows / rows_server:.1f}x fewer")
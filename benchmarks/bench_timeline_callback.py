@@ -0,0 +1,86 @@
+"""
+Benchmark the latency of the timeline callback for 1, 10 and 50 selected cells: building
+the multi-sensor figure and serialising it to JSON, as Dash does before sending it.
+The original per-sensor to_pandas/dropna with SVG traces is compared with the current
+NumPy path, on a week of 1-minute data.
+
+Run from the repository root:
+    python -m benchmarks.bench_timeline_callback
+"""
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import polars as pl
+from src.timeline_plot import create_multi_timeline_plot
+
+N_SENSORS = 50
+N_DAYS = 7               # of 1-minute data
+CELL_COUNTS = [1, 10, 50]
+GRAPH_WIDTH = 1200
+REPEATS = 3
+
+def make_dataset(rng):
+    """Wide data with 5% missing values, and the tables the plot looks the sensors up in."""
+    datetimes = pl.datetime_range(
+        datetime(2025, 7, 1), datetime(2025, 7, 1 + N_DAYS), '1m', closed='left', eager=True, time_zone='UTC'
+    )
+    n_rows = len(datetimes)
+    columns = {'datetime': datetimes}
+    for sensor_id in range(1, N_SENSORS + 1):
+        values = rng.normal(10, 2, n_rows)
+        values[rng.random(n_rows) < 0.05] = np.nan
+        columns[str(sensor_id)] = values
+    data_df = pl.DataFrame(columns).fill_nan(None)
+
+    stations = [f"ST{s:02d}" for s in range(1, N_SENSORS + 1)]
+    check_table = pd.DataFrame({'station': stations, 'source': 'wur_db', 'TA': [f"TA_{s}" for s in stations]})
+    nan_table = pd.DataFrame({
+        'Station': stations, 'Variable': 'TA', 'Sensor_ID': [str(i) for i in range(1, N_SENSORS + 1)]
+    })
+    selected_cells = [{'station': station, 'variable': 'TA'} for station in stations]
+    return data_df, check_table, nan_table, selected_cells
+
+def reference_multi_timeline(data_df, selected_cells, nan_table):
+    """The original traces: to_pandas and dropna per sensor, every point as SVG lines and markers."""
+    fig = go.Figure()
+    colors = px.colors.qualitative.Set3
+    sensor_ids = dict(zip(nan_table['Station'], nan_table['Sensor_ID']))
+    for i, cell in enumerate(selected_cells):
+        sensor_id = sensor_ids[cell['station']]
+        plot_data = data_df.select(['datetime', sensor_id]).to_pandas()
+        plot_data = plot_data.dropna(subset=[sensor_id])
+        fig.add_trace(go.Scatter(
+            x=plot_data['datetime'],
+            y=plot_data[sensor_id],
+            mode='lines+markers',
+            line=dict(width=.5, color=colors[i % len(colors)]),
+            marker=dict(size=4, color=colors[i % len(colors)]),
+        ))
+    fig.update_layout(template='plotly_white', hovermode='x unified', xaxis=dict(rangeslider=dict(visible=True), type='date'))
+    return fig
+
+def timeit(func, *args, **kwargs):
+    timings = []
+    for _ in range(REPEATS):
+        t0 = time.perf_counter()
+        payload = func(*args, **kwargs).to_json()
+        timings.append(time.perf_counter() - t0)
+    return min(timings), len(payload)
+
+if __name__ == '__main__':
+    data_df, check_table, nan_table, selected_cells = make_dataset(np.random.default_rng(0))
+    print(f"Rows: {data_df.height}, graph width: {GRAPH_WIDTH} px")
+    print(f"{'cells':>5} {'pandas (ms)':>12} {'numpy (ms)':>11} {'speedup':>8} {'payload (MB)':>20}")
+    for n_cells in CELL_COUNTS:
+        cells = selected_cells[:n_cells]
+        t_ref, size_ref = timeit(reference_multi_timeline, data_df, cells, nan_table)
+        t_new, size_new = timeit(
+            create_multi_timeline_plot, data_df, cells, check_table, nan_table, width=GRAPH_WIDTH
+        )
+        print(
+            f"{n_cells:>5} {t_ref * 1000:>12.1f} {t_new * 1000:>11.1f} {t_ref / t_new:>7.1f}x "
+            f"{size_ref / 1e6:>9.2f} -> {size_new / 1e6:>6.2f}"
+        )
@@ -1,14 +1,57 @@
 import os
+import shutil
 import pandas as pd
 import polars as pl
 from src.general import fix_start_end_dt
-from src.db import get_data_from_db
+from src.db import get_data_from_db, get_sensorinfo_from_db
+from src.partition_store import PartitionStore
+from src.lazy_data import LazyData
+from src.cadence import add_cadence_to_sensorinfo
+from src.availability_cube import CUBE_SCHEMA, compute_availability_cube, update_availability_cube
+from src.pyramid import PYRAMID_SCHEMA, compute_pyramid, update_pyramid
+from src.outliers import StreamingOutliers
+from src.cache_key import make_cache_key, get_sensor_keys
 from src.last_retrieval import (
-    check_if_download_data_needed,
     add_extra_info_to_sensorinfo,
+    check_if_download_data_needed,
+    check_if_sensors_stale,
+    check_if_sensors_changed,
     save_last_retrieval_info
 )
 
+# Rows per Parquet row group of the data file, one day of 1-minute data, so a query
+# for a time range only reads the row groups of the days in that range
+DATA_ROW_GROUP_SIZE = 1440
+
+def write_data_file(data_lf, path, start_dt, end_dt, row_group_size=DATA_ROW_GROUP_SIZE):
+    """
+    Write data_lf to one Parquet file without loading the whole window.
+    The plan is streamed with sink_parquet. When the streaming engine cannot run it (the
+    merge of overlapping partitions of the store), every day is collected and written on
+    its own, and the day files are streamed into the data file.
+    """
+    try:
+        data_lf.sink_parquet(path, row_group_size=row_group_size)
+        return
+    except pl.exceptions.InvalidOperationError:
+        pass
+
+    day_dir = f"{path}.days"
+    os.makedirs(day_dir, exist_ok=True)
+    day_files = []
+    for day_start in pd.date_range(pd.Timestamp(start_dt).floor('D'), end_dt, freq='D'):
+        day_df = data_lf.filter(
+            (pl.col('datetime') >= day_start) & (pl.col('datetime') < day_start + pd.Timedelta(days=1))
+        ).collect()
+        if day_df.height > 0:
+            day_files.append(os.path.join(day_dir, f"{len(day_files):05d}.parquet"))
+            day_df.write_parquet(day_files[-1])
+    if day_files:
+        pl.concat([pl.scan_parquet(f) for f in day_files]).sink_parquet(path, row_group_size=row_group_size)
+    else:
+        data_lf.limit(0).collect().write_parquet(path)
+    shutil.rmtree(day_dir)
+
 class DataManager:
     def __init__(
         self,
@@ -26,14 +69,21 @@ class DataManager:
         self.temp_path = temp_path
         self.data_df_file = os.path.join(data_path, 'data.parquet')
         self.sensorinfo_df_file = os.path.join(data_path, 'sensorinfo.parquet')
+        self.manifest_file = os.path.join(data_path, 'manifest.json')
+        self.availability_cube_file = os.path.join(data_path, 'availability_cube.parquet')
+        self.pyramid_file = os.path.join(data_path, 'pyramid.parquet')
+        self.store = PartitionStore(os.path.join(data_path, 'store'))
         self.check_table_filename = os.path.join(meta_path, 'check_table_base.csv')
         self.variable_info_file = os.path.join(meta_path, 'variables.csv')
-        self.last_retrieval_info_file = os.path.join(temp_path, 'last_run_config.txt')
-        self.last_retrieval_checktable_file = os.path.join(temp_path, 'check_table.txt')
+        self.sensorinfo_cache_dir = os.path.join(temp_path, 'sensorinfo_cache')
         self.data_df = None
         self.sensorinfo_df = None
+        self.availability_cube = None
+        self.pyramid = None
+        self.streaming_outliers = None
         self.check_table = None
         self.load_from_disk = False
+        self.lazy = False
         # Always use set_dates to initialize dates
         self.set_dates(
             start_dt=start_dt,
@@ -46,6 +96,13 @@ class DataManager:
     def set_load_from_disk(self, load_from_disk=False):
         self.load_from_disk = load_from_disk
 
+    def set_lazy(self, lazy=False):
+        """
+        In lazy mode data_df is a LazyData facade over the data file instead of a DataFrame,
+        queries only read the columns and row groups they need.
+        """
+        self.lazy = lazy
+
     def set_meta_path(self, path):
         self.meta_path = path
         self.check_table_filename = os.path.join(path, 'check_table_base.csv')
@@ -58,13 +115,16 @@ class DataManager:
 
         self.data_df_file = os.path.join(path, 'data.parquet')
         self.sensorinfo_df_file = os.path.join(path, 'sensorinfo.parquet')
+        self.manifest_file = os.path.join(path, 'manifest.json')
+        self.availability_cube_file = os.path.join(path, 'availability_cube.parquet')
+        self.pyramid_file = os.path.join(path, 'pyramid.parquet')
+        self.store = PartitionStore(os.path.join(path, 'store'))
         
     def set_temp_path(self, path):
         self.temp_path = path
         if not os.path.exists(path):
             os.makedirs(path)
-        self.last_retrieval_info_file = os.path.join(path, 'last_run_config.txt')
-        self.last_retrieval_checktable_file = os.path.join(path, 'check_table.txt')
+        self.sensorinfo_cache_dir = os.path.join(path, 'sensorinfo_cache')
         
     def set_dates(self, start_dt=None, end_dt=None, days_back=7, offset=2, tz='UTC'):
         """
@@ -97,49 +157,149 @@ class DataManager:
 
     def download_or_load_data(self):
         self.load_check_table()
-        download_data = check_if_download_data_needed(
-            self.last_retrieval_info_file,
-            self.start_dt,
-            self.end_dt,
-            self.last_retrieval_checktable_file,
-            self.check_table,
-            self.data_df_file,
-            self.sensorinfo_df_file
-        )
+        downloaded = False
         if not self.load_from_disk:
-            if download_data:
-                self.sensorinfo_df, self.data_df = get_data_from_db(
-                    start_dt=self.start_dt,
-                    end_dt=self.end_dt,
-                    check_table_filename=self.check_table_filename
-            )
-            # Save as Polars parquet files
-            if self.data_df is not None and self.data_df.height > 0:
-                self.data_df.write_parquet(self.data_df_file)
-            if self.sensorinfo_df is not None and self.sensorinfo_df.height > 0:
-                self.sensorinfo_df.write_parquet(self.sensorinfo_df_file)
-        else:
-            # Load as Polars DataFrames
-            if os.path.exists(self.data_df_file):
-                self.data_df = pl.read_parquet(self.data_df_file)
+            # Compare the cache key with the manifest first, the sensors are only resolved
+            # from the database when the key misses or the sensors in the manifest are stale
+            cache_key = make_cache_key(self.check_table, self.start_dt, self.end_dt)
+            download_needed = check_if_download_data_needed(self.manifest_file, cache_key, self.data_df_file, self.sensorinfo_df_file)
+            if not download_needed and check_if_sensors_stale(self.manifest_file):
+                sensorinfo_df = get_sensorinfo_from_db(
+                    check_table_filename=self.check_table_filename,
+                    cache_dir=self.sensorinfo_cache_dir
+                )
+                download_needed = check_if_sensors_changed(self.manifest_file, get_sensor_keys(sensorinfo_df))
+            if download_needed:
+                self.download_data()
+                downloaded = True
+                save_last_retrieval_info(
+                    self.manifest_file,
+                    cache_key,
+                    get_sensor_keys(self.sensorinfo_df),
+                    self.start_dt,
+                    self.end_dt,
+                    self.store.settle_time
+                )
             else:
-                self.data_df = pl.DataFrame()
-            if os.path.exists(self.sensorinfo_df_file):
-                self.sensorinfo_df = pl.read_parquet(self.sensorinfo_df_file)
-            else:
-                self.sensorinfo_df = pl.DataFrame()
+                self.load_data_files()
+        else:
+            self.load_data_files()
                 
         # Convert sensorinfo_df to pandas for add_extra_info_to_sensorinfo function
         if self.sensorinfo_df is not None and self.sensorinfo_df.height > 0:
             self.sensorinfo_df = add_extra_info_to_sensorinfo(self.sensorinfo_df, self.variable_info_file)
-        
-        save_last_retrieval_info(
-            self.check_table,
-            self.start_dt,
-            self.end_dt,
-            self.last_retrieval_info_file,
-            self.last_retrieval_checktable_file
+
+        # Per-sensor, per-hour availability counts, updated when new data was downloaded
+        self.load_availability_cube(update=downloaded)
+        # Min/mean/max per 10 minutes, hour and day for the plots, updated when new data was downloaded
+        self.load_pyramid(update=downloaded)
+
+    def load_availability_cube(self, update=False):
+        """
+        Load the availability cube. After a download it is updated incrementally: only the
+        new and the unsettled periods are computed, the periods that left the window are dropped.
+        """
+        if os.path.exists(self.availability_cube_file):
+            cube = pl.read_parquet(self.availability_cube_file)
+            # A cube saved with other columns is rebuilt
+            if cube.schema == CUBE_SCHEMA:
+                self.availability_cube = cube
+                if not update:
+                    return
+        if self.data_df is None or len(self.data_df.columns) == 0:
+            self.availability_cube = None
+            return
+        if self.availability_cube is not None:
+            self.availability_cube = update_availability_cube(
+                self.availability_cube,
+                self.data_df,
+                self.sensorinfo_df,
+                self.start_dt,
+                self.end_dt,
+                refresh_from=pd.Timestamp.now(tz='UTC') - self.store.settle_time
+            )
+        else:
+            self.availability_cube = compute_availability_cube(self.data_df, self.sensorinfo_df)
+        self.availability_cube.write_parquet(self.availability_cube_file)
+
+    def load_pyramid(self, update=False):
+        """
+        Load the aggregation pyramid of the data (see src/pyramid.py). After a download it is
+        updated incrementally: only the new and the unsettled days are computed, the days
+        that left the window are dropped.
+        """
+        if os.path.exists(self.pyramid_file):
+            pyramid = pl.read_parquet(self.pyramid_file)
+            # A pyramid saved with other columns is rebuilt
+            if pyramid.schema == PYRAMID_SCHEMA:
+                self.pyramid = pyramid
+                if not update:
+                    return
+        if self.data_df is None or len(self.data_df.columns) == 0:
+            self.pyramid = None
+            return
+        if self.pyramid is not None:
+            self.pyramid = update_pyramid(
+                self.pyramid,
+                self.data_df,
+                self.start_dt,
+                self.end_dt,
+                refresh_from=pd.Timestamp.now(tz='UTC') - self.store.settle_time
+            )
+        else:
+            self.pyramid = compute_pyramid(self.data_df)
+        self.pyramid.write_parquet(self.pyramid_file)
+
+    def download_data(self):
+        # The sampling interval of the sensors that were seen before is kept
+        previous_sensorinfo_df = None
+        if os.path.exists(self.sensorinfo_df_file):
+            previous_sensorinfo_df = pl.read_parquet(self.sensorinfo_df_file)
+
+        # The coverage index of the store decides per sensor which periods are missing,
+        # only those are downloaded and the window is assembled from the local partitions.
+        # Rolling z-score outliers of the downloaded data are flagged while the chunks arrive.
+        self.streaming_outliers = StreamingOutliers()
+        self.sensorinfo_df, data_lf = get_data_from_db(
+            start_dt=self.start_dt,
+            end_dt=self.end_dt,
+            check_table_filename=self.check_table_filename,
+            cache_dir=self.sensorinfo_cache_dir,
+            store=self.store,
+            on_chunk=self.streaming_outliers
         )
+        self.streaming_outliers.finish()
+        print(f"Rolling z-score outliers in the downloaded data: {sum(self.streaming_outliers.count().values())}")
+        # Assemble the window from the partitions into the data file, without loading it all
+        if len(data_lf.collect_schema()) > 0:
+            write_data_file(data_lf, self.data_df_file, self.start_dt, self.end_dt)
+            if self.lazy:
+                self.data_df = LazyData.scan(self.data_df_file)
+            else:
+                self.data_df = pl.read_parquet(self.data_df_file)
+        else:
+            self.data_df = pl.DataFrame()
+        # Save as Polars parquet files, with the sampling interval of the sensors new in the data
+        if self.sensorinfo_df is not None and self.sensorinfo_df.height > 0:
+            self.sensorinfo_df = add_cadence_to_sensorinfo(self.sensorinfo_df, self.data_df, previous_sensorinfo_df)
+            self.sensorinfo_df.write_parquet(self.sensorinfo_df_file)
+
+    def load_data_files(self):
+        # Load as Polars DataFrames
+        if os.path.exists(self.data_df_file) and self.lazy:
+            self.data_df = LazyData.scan(self.data_df_file)
+        elif os.path.exists(self.data_df_file):
+            self.data_df = pl.read_parquet(self.data_df_file)
+        else:
+            self.data_df = pl.DataFrame()
+        if os.path.exists(self.sensorinfo_df_file):
+            self.sensorinfo_df = pl.read_parquet(self.sensorinfo_df_file)
+            # Files saved without the sampling interval get it inferred once
+            if self.sensorinfo_df.height > 0 and 'cadence' not in self.sensorinfo_df.columns:
+                self.sensorinfo_df = add_cadence_to_sensorinfo(self.sensorinfo_df, self.data_df)
+                self.sensorinfo_df.write_parquet(self.sensorinfo_df_file)
+        else:
+            self.sensorinfo_df = pl.DataFrame()
 
     def get_data(self):
         return self.data_df, self.sensorinfo_df
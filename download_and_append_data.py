@@ -2,8 +2,8 @@ import os
 import pandas as pd
 
 from src.general import fix_start_end_dt, adapt_start_dt_to_existing_dataset
-from src.general import get_check_table
-from src.db import get_data
+from src.general import get_check_table, match_existing_header
+from src.db import get_sensorinfo, iter_wide_data_pages
  
 if __name__ == "__main__":
 
@@ -27,63 +27,60 @@ if __name__ == "__main__":
         # Select the current station from the check_table
         check_table_tmp = check_table[check_table['Station'] == station]
         
-        limit = 100000
-        # Loop till data_df is None or empty
-        while True:
-            # Fix the start and end datetime strings
-            start_dt, end_dt = fix_start_end_dt(start_dt_init, end_dt_init, tz)
+        source = check_table_tmp['source'].values[0]
+        if source not in ['vu_db', 'wur_db']:
+            print(f"Unknown source for station {station}. Skipping...")
+            continue
 
-            # Adapt start_dt to last line in existing dataset/file
-            start_dt = adapt_start_dt_to_existing_dataset(start_dt, end_dt, file, tz)
-            print(f"Start date set to: {start_dt}. End date set to: {end_dt}.")
+        # Fix the start and end datetime strings
+        start_dt, end_dt = fix_start_end_dt(start_dt_init, end_dt_init, tz)
 
-            # If 'source' is 'vu_db', get the check_table for the vu_db
-            if check_table_tmp['source'].values[0] == 'vu_db':
-                # Get data from the database
-                sensorinfo_df, data_df = get_data(check_table_tmp, start_dt, end_dt, source='vu_db', limit=limit)
-            elif check_table_tmp['source'].values[0] == 'wur_db':    
-                # Get data from the database
-                sensorinfo_df, data_df = get_data(check_table_tmp, start_dt, end_dt, source='wur_db', limit=limit)
-            else:
-                print(f"Unknown source for station {station}. Skipping...")
-                continue
-            # If data_df is not None and not empty, break the loop
-            if data_df is None or data_df.empty:
-                break
-            
-            if sensorinfo_df is None or data_df is None:
-                print(f"No data found for {station} in the specified date range.")
-                continue
+        # Adapt start_dt to last line in existing dataset/file
+        start_dt = adapt_start_dt_to_existing_dataset(start_dt, end_dt, file, tz)
+        if isinstance(start_dt, tuple):
+            # Existing file is already up to date
+            continue
+        print(f"Start date set to: {start_dt}. End date set to: {end_dt}.")
 
-            # Make header data 
-            # Line 1: first column is datetime, the rest are the variable names
-            header_data = pd.DataFrame(columns=['datetime'] + sensorinfo_df['sensor_name'].tolist())
-            # Line 2: first column is '-', the rest are the units of the variables
-            header_data.loc[0] = ['-'] + sensorinfo_df['unit'].tolist()
-            
-            ##### TODO: be sure that the order of columns in header_data matches the order of columns in data_df
-            
-            ##### TODO: be sure that the order and the number of columns in the file matches the order of columns in header_data and data_df
-            
-            # if file exists
-            if os.path.exists(file):
-                
-                # Append the new data to the file add enter at the if needed
-                data_df.to_csv(file, mode='a', header=False, index=True, na_rep='NA')
-            else:
-                # Write the new data to a new file the header is written first
-                # the header contains 3 lines with the column names, units and aggregation
-                # the first column is the datetime column
+        # Resolve the sensors of this station once
+        sensorinfo_df = get_sensorinfo(check_table_tmp, source=source)
+        if sensorinfo_df is None or sensorinfo_df.height == 0:
+            print(f"No sensors found for {station}. Skipping...")
+            continue
+        sensorids = sensorinfo_df['sensor_id'].to_list()
+
+        # Make header data 
+        # Line 1: first column is datetime, the rest are the variable names
+        # Line 2: first column is '-', the rest are the units of the variables
+        # The data columns are in the order of sensorids, same as sensorinfo_df
+        header_names = ['datetime'] + sensorinfo_df['sensor_name'].to_list()
+        header_units = ['-'] + [str(unit) for unit in sensorinfo_df['unit'].to_list()]
+
+        # An existing file gets the data in the column order of its header,
+        # a file with other sensors than the current ones is not appended to
+        positions = match_existing_header(file, header_names, header_units)
+        if positions is None:
+            print(f"The header of {file} does not match the current sensors of {station}. Skipping...")
+            continue
+        data_columns = ['datetime'] + [str(sensorid) for sensorid in sensorids]
+        file_columns = [data_columns[i] for i in positions]
+
+        # Stream keyset-paginated pages to the file, only one page is held in memory
+        page_size = 100000
+        for data_df in iter_wide_data_pages(sensorids, start_dt, end_dt, source=source, page_size=page_size):
+            print(f"{station}: writing {data_df.height} rows from {data_df['datetime'][0]} to {data_df['datetime'][-1]}")
+            data_df = data_df.select(file_columns)
+
+            if not os.path.exists(file):
+                # Write the header first, the first column is the datetime column
                 with open(file, 'w') as f:
+                    f.write(','.join(header_names) + '\n')
+                    f.write(','.join(header_units) + '\n')
 
-                    # Write the header
-                    header_data.to_csv(f, index=False, header=True, na_rep='NA')
-                    
-                    # Write the data
-                    data_df.to_csv(f, index=True, header=False, na_rep='NA')
+            # Append the new data to the file
+            with open(file, 'a') as f:
+                data_df.write_csv(f, include_header=False, null_value='NA', datetime_format='%Y-%m-%d %H:%M:%S%z')
 
-            
-                        
         # # If 'source' is 'vu_db', get the check_table for the vu_db
         # if check_table_tmp['source'].values[0] == 'vu_db':
         #     # Get data from the database
@@ -7,6 +7,8 @@ from src.tablenew import create_sensor_issue_table
 from src.callbacks import register_callbacks
 from src.aggrid_table import create_aggrid_datatable
 from src.layout import create_app_layout
+from src.pyramid import scale_pyramid
+from src.cadence import get_cadence_minutes
 from src.data_processing import create_pivot_table, create_pivot_table_reason
 # from src.table import get_cell_values_and_colors, get_datatable #, generate_color_rules_and_css
 from data_manager import DataManager
@@ -34,6 +36,7 @@ def download_and_compare_data(application='standalone'):
     print(f"start_dt: {dm.start_dt}, end_dt: {dm.end_dt}")
 
     dm.set_load_from_disk(True)
+    dm.set_lazy(True)
 
     dm.download_or_load_data()
     data_df, sensorinfo_df = dm.get_data()
@@ -50,6 +53,8 @@ def download_and_compare_data(application='standalone'):
     if incorrect_sensors:
         print("Correcting air pressure sensors:", incorrect_sensors)
         data_df, sensorinfo_df = correct_airpressure_units(data_df, sensorinfo_df, incorrect_sensors)
+        if dm.pyramid is not None:
+            dm.pyramid = scale_pyramid(dm.pyramid, incorrect_sensors, 10)
 
     # Prepare names
     check_table = dm.check_table  # This stays as pandas
@@ -58,7 +63,10 @@ def download_and_compare_data(application='standalone'):
     site_names.sort()
 
     # Create the data availability percentage table
-    nan_table = create_sensor_issue_table(data_df, sensorinfo_df, check_table)
+    nan_table = create_sensor_issue_table(
+        data_df, sensorinfo_df, check_table,
+        cube=dm.availability_cube, start_dt=dm.start_dt, end_dt=dm.end_dt
+    )
     
     # Create pivot table for AgGrid display
     pivot_table = create_pivot_table(nan_table)
@@ -82,7 +90,10 @@ def download_and_compare_data(application='standalone'):
     app.layout = create_app_layout(dm, data_df, aggrid_datatable, pivot_table)
     
     # Register callbacks from separate file
-    register_callbacks(app, pivot_table, check_table, nan_table, data_df)
+    register_callbacks(
+        app, pivot_table, check_table, nan_table, data_df,
+        pyramid=dm.pyramid, cadences=get_cadence_minutes(sensorinfo_df)
+    )
     
     return app
 
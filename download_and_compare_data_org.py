@@ -4,6 +4,7 @@ from dash import dcc, html, Input, Output, State, ctx, dash_table
 from src.plot import make_figure  
 from src.corrections import find_incorrect_airpressure_sensors, correct_airpressure_units 
 from src.table import get_cell_values_and_colors, get_datatable
+from src.outliers import OUTLIER_METHODS, OutlierEngine
 from data_manager import DataManager
 import plotly.graph_objects as go
 import polars as pl
@@ -84,51 +85,8 @@ def download_and_compare_data(application='standalone'):
 
     sensor_names = list(sensor_groups.keys())
 
-    # Get all ATMP sensor_ids using Polars
-    atmp_sensors_df = sensorinfo_df.filter(pl.col('variable_name') == 'ATMP')
-    atmp_sensors = atmp_sensors_df['sensor_id'].to_list()
-
-    # Convert to pandas for outlier calculations (easier with current numpy operations)
-    atmp_columns = [str(s) for s in atmp_sensors if str(s) in data_df.columns]
-    if atmp_columns:
-        # Convert datetime column to index for outlier calculations
-        atmp_data = data_df.select(['datetime'] + atmp_columns).to_pandas().set_index('datetime')
-        
-        # Calculate outlier masks using existing numpy operations
-        with np.errstate(divide='ignore', invalid='ignore'):
-            atmp_zscores = (atmp_data - atmp_data.mean(axis=1, skipna=True).values[:, None]) / atmp_data.std(axis=1, skipna=True).values[:, None]
-            atmp_zscores = atmp_zscores.fillna(0)
-            zscore_outlier_mask = np.abs(atmp_zscores) > 4
-
-            Q1 = atmp_data.quantile(0.25)
-            Q3 = atmp_data.quantile(0.75)
-            IQR = Q3 - Q1
-            iqr_outlier_mask = (atmp_data < (Q1 - 1.5 * IQR)) | (atmp_data > (Q3 + 1.5 * IQR))
-
-            median = atmp_data.median(axis=1, skipna=True)
-            mad = (np.abs(atmp_data.sub(median, axis=0))).median(axis=1, skipna=True)
-            modz = 0.6745 * (atmp_data.sub(median, axis=0)).div(mad, axis=0)
-            modz = modz.fillna(0)
-            modz_outlier_mask = np.abs(modz) > 3.5
-
-            lower = atmp_data.quantile(0.01)
-            upper = atmp_data.quantile(0.99)
-            percentile_outlier_mask = (atmp_data < lower) | (atmp_data > upper)
-
-            window = 24
-            rolling_mean = atmp_data.rolling(window, min_periods=1, center=True).mean()
-            rolling_std = atmp_data.rolling(window, min_periods=1, center=True).std()
-            rolling_zscore = (atmp_data - rolling_mean) / rolling_std
-            rolling_zscore = rolling_zscore.fillna(0)
-            rolling_outlier_mask = np.abs(rolling_zscore) > 4
-    else:
-        # Create empty masks if no ATMP data
-        atmp_data = None
-        zscore_outlier_mask = None
-        iqr_outlier_mask = None
-        modz_outlier_mask = None
-        percentile_outlier_mask = None
-        rolling_outlier_mask = None
+    # Outlier masks of all variables, computed per (variable, method) when first shown
+    outlier_engine = OutlierEngine(data_df, sensorinfo_df)
 
     # Dash app
     BS = "https://cdn.jsdelivr.net/npm/bootstrap@5.3.6/dist/css/bootstrap.min.css"
@@ -181,13 +139,7 @@ def download_and_compare_data(application='standalone'):
         ),
         dcc.Dropdown(
             id='outlier-method',
-            options=[
-                {'label': 'Z-score', 'value': 'zscore'},
-                {'label': 'IQR', 'value': 'iqr'},
-                {'label': 'Modified Z-score', 'value': 'modz'},
-                {'label': 'Percentile (1-99%)', 'value': 'percentile'},
-                {'label': 'Rolling Window Z-score', 'value': 'rolling'}
-            ],
+            options=[{'label': label, 'value': method} for method, label in OUTLIER_METHODS.items()],
             value='zscore',
             clearable=False,
             style={'width': '200px', 'margin': '10px'}
@@ -199,6 +151,9 @@ def download_and_compare_data(application='standalone'):
         ])
     ])
 
+    # Shared x values of all traces, converted once
+    plot_datetimes = data_df['datetime'].dt.replace_time_zone(None).to_numpy()
+
     @app.callback(
         Output('highlight-graph', 'figure'),
         [Input('nan-table', 'selectedRows'),  # Changed from selected_cells
@@ -235,33 +190,22 @@ def download_and_compare_data(application='standalone'):
                 continue
                 
             # Select outlier mask for this variable and method
-            mask = None
-            if var == 'ATMP' and atmp_data is not None:
-                if outlier_method == 'iqr':
-                    mask = iqr_outlier_mask
-                elif outlier_method == 'modz':
-                    mask = modz_outlier_mask
-                elif outlier_method == 'percentile':
-                    mask = percentile_outlier_mask
-                elif outlier_method == 'rolling':
-                    mask = rolling_outlier_mask
-                else:
-                    mask = zscore_outlier_mask
+            mask = outlier_engine.mask(var, outlier_method)
                     
             for sensor in sensors:
                 sensor_str = str(sensor)
                 if sensor_str not in data_df.columns:
                     continue
                     
-                # Convert to pandas for plotting
-                plot_data = data_df.select(['datetime', sensor_str]).to_pandas().set_index('datetime')
-                y = plot_data[sensor_str].copy()
+                # Values as a NumPy array, nulls become NaN
+                values = data_df[sensor_str].cast(pl.Float64).to_numpy()
+                y = values
                 
-                if var == 'ATMP' and mask is not None and sensor_str in atmp_data.columns and 'remove' in show_outliers:
-                    y = y.mask(mask[sensor_str])
+                if mask is not None and sensor_str in mask and 'remove' in show_outliers:
+                    y = np.where(mask.get(sensor_str), np.nan, values)
                     
-                fig.add_trace(go.Scatter(
-                    x=plot_data.index,
+                fig.add_trace(go.Scattergl(
+                    x=plot_datetimes,
                     y=y,
                     mode='lines+markers',
                     name=f"{site} ({sensor})",
@@ -269,11 +213,11 @@ def download_and_compare_data(application='standalone'):
                     marker=dict(size=3)
                 ))
                 
-                if var == 'ATMP' and mask is not None and sensor_str in atmp_data.columns and 'show' in show_outliers:
-                    outlier_idx = mask[sensor_str]
-                    fig.add_trace(go.Scatter(
-                        x=atmp_data.index[outlier_idx],
-                        y=atmp_data[sensor_str][outlier_idx],
+                if mask is not None and sensor_str in mask and 'show' in show_outliers:
+                    outlier_idx = mask.indices(sensor_str)
+                    fig.add_trace(go.Scattergl(
+                        x=plot_datetimes[outlier_idx],
+                        y=values[outlier_idx],
                         mode='markers',
                         marker=dict(color='red', size=12, symbol='x'),
                         name=f"{site} ({sensor}) Outlier"
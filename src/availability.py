@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+import polars as pl
+from src.cadence import get_cadence_minutes, grid_column, infer_cadence, reshape_counts, with_grid_columns
+
+def compute_sensor_stats(data_df, sensor_ids, cadences=None):
+    """
+    Null counts of all sensor columns in one pass over data_df (DataFrame, LazyFrame or LazyData).
+    cadences maps sensor_id to its sampling interval in minutes (see src/cadence.py), the
+    cadence of sensors that are not in it is inferred first.
+    Returns a Polars DataFrame with per sensor_id:
+        n_null       number of null values
+        n_valid      number of non-null values
+        n_slots      number of timestamps on the grid of the sensor's cadence
+        n_slot_null  null values on those timestamps
+    Irregular sensors are counted on all timestamps.
+    """
+    data_columns = set(data_df.columns)
+    columns = [sid for sid in dict.fromkeys(sensor_ids) if sid in data_columns]
+    if len(columns) == 0:
+        return pl.DataFrame(schema={
+            'sensor_id': pl.Utf8, 'n_null': pl.UInt32, 'n_valid': pl.UInt32,
+            'n_slots': pl.UInt32, 'n_slot_null': pl.UInt32
+        })
+
+    cadences = dict(cadences or {})
+    unknown = [sid for sid in columns if sid not in cadences]
+    if unknown:
+        inferred = infer_cadence(data_df, unknown)
+        cadences.update(zip(inferred['sensor_id'].to_list(), inferred['cadence_minutes'].to_list()))
+
+    # Group the columns by cadence, every group is counted on its own grid
+    groups = {}
+    for sid in columns:
+        groups.setdefault(cadences.get(sid), []).append(sid)
+
+    exprs = []
+    for minutes, group in groups.items():
+        on_grid = pl.col(grid_column(minutes))
+        exprs += [
+            pl.col(group).null_count().name.suffix('|n_null'),
+            pl.col(group).count().name.suffix('|n_valid'),
+            pl.col(group).filter(on_grid).len().name.suffix('|n_slots'),
+            pl.col(group).filter(on_grid).null_count().name.suffix('|n_slot_null'),
+        ]
+    counts = with_grid_columns(data_df.lazy(), groups).select(exprs).collect()
+
+    # One row per sensor
+    return reshape_counts(counts, ['n_null', 'n_valid', 'n_slots', 'n_slot_null']).with_columns(
+        pl.exclude('sensor_id').cast(pl.UInt32)
+    )
+
+def create_availability_table(data_df, sensorinfo_df, check_table, stats=None):
+    """
+    Data availability per station and variable of the check_table, computed in one pass.
+    Precomputed per-sensor stats (e.g. summed from the availability cube) can be given
+    instead, then data_df is not read.
+    Returns a pandas DataFrame with the columns Station, Variable, Sensor_Name, Sensor_ID,
+    NaN_Percentage (percentage available) and Reason (OK, ND, NF or N/A).
+    """
+    var_names = list(check_table.columns[2:])  # Skip 'station' and 'source' columns
+
+    # One row per (station, variable) in check_table order
+    cells = check_table[['station'] + var_names].melt(
+        id_vars='station', var_name='Variable', value_name='Sensor_Name', ignore_index=False
+    )
+    cells['row'] = cells.index
+    cells['col'] = cells['Variable'].map({var: i for i, var in enumerate(var_names)})
+    cells = cells.sort_values(['row', 'col']).rename(columns={'station': 'Station'})
+
+    # Map (station, sensor_name) to sensor_id, the last sensor wins if a name occurs twice
+    if sensorinfo_df is not None and sensorinfo_df.height > 0:
+        sensor_index = (
+            sensorinfo_df.select(['site_name', 'sensor_name', pl.col('sensor_id').cast(pl.Utf8)])
+            .unique(subset=['site_name', 'sensor_name'], keep='last', maintain_order=True)
+            .to_pandas()
+            .rename(columns={'site_name': 'Station', 'sensor_name': 'Sensor_Name', 'sensor_id': 'Sensor_ID'})
+        )
+        missing_stations = set(check_table['station']) - set(sensor_index['Station'])
+    else:
+        sensor_index = pd.DataFrame(columns=['Station', 'Sensor_Name', 'Sensor_ID'])
+        missing_stations = set(check_table['station'])
+    for station in sorted(missing_stations, key=str):
+        print(f"Warning: No sensor info found for station {station}. Skipping.")
+
+    not_checked = cells['Sensor_Name'].isna() | (cells['Sensor_Name'] == '')
+    cells = cells.merge(sensor_index, on=['Station', 'Sensor_Name'], how='left')
+    cells['Sensor_ID'] = cells['Sensor_ID'].where(~not_checked.to_numpy(), '').fillna('')
+
+    # Counts of all sensor columns at once, on the grid of their cadence
+    if stats is None:
+        stats = compute_sensor_stats(
+            data_df,
+            cells['Sensor_ID'][cells['Sensor_ID'] != ''].unique().tolist(),
+            cadences=get_cadence_minutes(sensorinfo_df)
+        )
+    cells = cells.merge(stats.to_pandas(), left_on='Sensor_ID', right_on='sensor_id', how='left')
+
+    found = cells['n_valid'].notna().to_numpy()
+    no_data = found & (cells['n_valid'] == 0).to_numpy()
+    # Only the expected timestamps of the sensor's cadence are counted
+    n_slots = cells['n_slots'].to_numpy(dtype=float, na_value=np.nan)
+    n_slot_null = cells['n_slot_null'].to_numpy(dtype=float, na_value=np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        availability = (n_slots - n_slot_null) / n_slots * 100
+
+    not_checked = not_checked.to_numpy()
+    cells['NaN_Percentage'] = np.select(
+        [not_checked, ~found, no_data], [0.0, 0.0, 0.0], default=availability
+    ).round(1)
+    cells['Reason'] = np.select(
+        [not_checked, ~found, no_data], ['N/A', 'NF', 'ND'], default='OK'
+    )
+    cells['Sensor_Name'] = cells['Sensor_Name'].where(cells['Sensor_Name'].notna(), '')
+
+    return cells[['Station', 'Variable', 'Sensor_Name', 'Sensor_ID', 'NaN_Percentage', 'Reason']].reset_index(drop=True)
@@ -0,0 +1,179 @@
+import numpy as np
+import pandas as pd
+import polars as pl
+from src.lazy_data import LazyData
+from src.cadence import get_cadence_minutes, grid_column, infer_cadence, with_grid_columns
+from src.outliers import ROLLING_WINDOW, StreamingOutliers
+
+# Period of one cube row, daily (or longer) totals are sums of these rows
+CUBE_EVERY = '1h'
+
+CUBE_SCHEMA = {
+    'sensor_id': pl.Utf8, 'period': pl.Datetime('us', 'UTC'),
+    'n_valid': pl.UInt32, 'n_slots': pl.UInt32, 'n_available': pl.UInt32, 'n_outliers': pl.UInt32
+}
+
+# Data around a range of periods that the rolling z-score of its rows reads (half the centred
+# window), in whole periods
+OUTLIER_MARGIN = (pd.Timedelta(ROLLING_WINDOW) / 2).ceil(CUBE_EVERY)
+
+def compute_availability_cube(data_df, sensorinfo_df=None, every=CUBE_EVERY):
+    """
+    Availability cube of data_df (DataFrame, LazyFrame or LazyData): one row per sensor
+    and period with
+        n_valid      number of non-null values
+        n_slots      number of timestamps on the grid of the sensor's cadence
+        n_available  non-null values on those timestamps
+        n_outliers   rolling z-score outliers (see count_outliers)
+    The counts can be added up over periods, so the availability of any window (see
+    sum_availability_cube) follows from the rows of its periods.
+    The cadence comes from sensorinfo_df if it has one, else it is inferred.
+    """
+    columns = [col for col in data_df.columns if col != 'datetime']
+    if len(columns) == 0:
+        return pl.DataFrame(schema=CUBE_SCHEMA)
+
+    cadences = get_cadence_minutes(sensorinfo_df)
+    unknown = [sid for sid in columns if sid not in cadences]
+    if unknown:
+        inferred = infer_cadence(data_df, unknown)
+        cadences.update(zip(inferred['sensor_id'].to_list(), inferred['cadence_minutes'].to_list()))
+
+    # Group the columns by cadence, every group is counted on its own grid
+    groups = {}
+    for sid in columns:
+        groups.setdefault(cadences.get(sid), []).append(sid)
+    aggs = []
+    for minutes, group in groups.items():
+        on_grid = pl.col(grid_column(minutes))
+        aggs += [
+            pl.col(group).count().name.suffix('|n_valid'),
+            pl.col(group).filter(on_grid).len().name.suffix('|n_slots'),
+            pl.col(group).filter(on_grid).count().name.suffix('|n_available'),
+        ]
+
+    # One pass over the data, one row per period with three counts per sensor
+    wide = (
+        with_grid_columns(data_df.lazy(), groups)
+        .sort('datetime')
+        .group_by_dynamic('datetime', every=every)
+        .agg(aggs)
+        .collect()
+    )
+    if wide.height == 0:
+        return pl.DataFrame(schema=CUBE_SCHEMA)
+
+    # One row per sensor and period
+    return (
+        wide.unpivot(index='datetime')
+        .with_columns(pl.col('variable').str.split_exact('|', 1).alias('parts'))
+        .unnest('parts')
+        .rename({'field_0': 'sensor_id', 'field_1': 'stat', 'datetime': 'period'})
+        .pivot(on='stat', index=['sensor_id', 'period'], values='value')
+        .join(count_outliers(data_df, columns, every), on=['sensor_id', 'period'], how='left')
+        .with_columns(pl.col('n_outliers').fill_null(0))
+        .select(list(CUBE_SCHEMA))
+        .cast(CUBE_SCHEMA)
+        .sort(['sensor_id', 'period'])
+    )
+
+def count_outliers(data_df, columns, every=CUBE_EVERY):
+    """
+    Number of rolling z-score outliers (see StreamingOutliers in src/outliers.py) per sensor
+    and period of data_df. The data is read and flagged one day at a time.
+    Returns a Polars DataFrame with sensor_id, period and n_outliers, periods without
+    outliers are left out.
+    """
+    data_lf = data_df.lazy().select(['datetime'] + list(columns))
+    bounds = data_lf.select(pl.col('datetime').min().alias('start'), pl.col('datetime').max().alias('end')).collect()
+    outliers = StreamingOutliers()
+    if bounds['start'][0] is not None:
+        for day_start in pd.date_range(pd.Timestamp(bounds['start'][0]).floor('D'), bounds['end'][0], freq='D'):
+            outliers.update(data_lf.filter(
+                (pl.col('datetime') >= day_start) & (pl.col('datetime') < day_start + pd.Timedelta(days=1))
+            ).collect())
+    outliers.finish()
+
+    times = {sensor_id: outliers.outlier_times(sensor_id) for sensor_id in columns}
+    return (
+        pl.DataFrame({
+            'sensor_id': [sensor_id for sensor_id, t in times.items() for _ in range(len(t))],
+            'period': np.concatenate([np.empty(0, dtype='datetime64[ns]'), *times.values()]),
+        }, schema={'sensor_id': pl.Utf8, 'period': pl.Datetime('ns')})
+        .with_columns(pl.col('period').dt.replace_time_zone('UTC').dt.cast_time_unit('us').dt.truncate(every))
+        .group_by(['sensor_id', 'period'])
+        .agg(pl.len().alias('n_outliers'))
+    )
+
+def sum_availability_cube(cube, start_dt=None, end_dt=None):
+    """
+    Per-sensor totals of the cube rows of the periods that overlap start_dt to end_dt,
+    in the format of compute_sensor_stats (n_valid, n_slots, n_slot_null), plus n_outliers.
+    """
+    cube_lf = cube.lazy()
+    if start_dt is not None:
+        cube_lf = cube_lf.filter(pl.col('period') >= pd.Timestamp(start_dt).floor(CUBE_EVERY))
+    if end_dt is not None:
+        cube_lf = cube_lf.filter(pl.col('period') <= end_dt)
+    return (
+        cube_lf.group_by('sensor_id')
+        .agg(pl.col(['n_valid', 'n_slots', 'n_available', 'n_outliers']).sum())
+        .with_columns((pl.col('n_slots') - pl.col('n_available')).alias('n_slot_null'))
+        .select(['sensor_id', 'n_valid', 'n_slots', 'n_slot_null', 'n_outliers'])
+        .collect()
+    )
+
+def update_availability_cube(cube, data_df, sensorinfo_df, start_dt, end_dt, refresh_from=None):
+    """
+    Bring a cube up to date for the window start_dt to end_dt, without rescanning data_df:
+    - rows of periods that slid out of the window are dropped,
+    - only the periods that are not in the cube yet, and the periods from refresh_from on
+      (data that may still have changed in the database), are computed from data_df,
+    - sensors that are new in data_df are computed for the periods already in the cube.
+    The outliers of the periods next to a recomputed range depend on the data in it
+    (OUTLIER_MARGIN), so those periods are recomputed as well.
+    """
+    window_start = pd.Timestamp(start_dt).floor(CUBE_EVERY)
+    data_df = data_time_range(data_df, start_dt, end_dt)
+    cube = cube.filter((pl.col('period') >= window_start) & (pl.col('period') <= end_dt))
+    if cube.height == 0:
+        return compute_availability_cube(data_df, sensorinfo_df)
+
+    # Keep the settled periods of the cube, recompute everything around them
+    first_period = cube['period'].min()
+    refresh_start = cube['period'].max() + pd.Timedelta(CUBE_EVERY)
+    if refresh_from is not None:
+        refresh_start = max(first_period, min(refresh_start, pd.Timestamp(refresh_from).floor(CUBE_EVERY)))
+    keep_start = first_period + OUTLIER_MARGIN
+    keep_end = refresh_start - OUTLIER_MARGIN
+    if keep_start >= keep_end:
+        return compute_availability_cube(data_df, sensorinfo_df)
+    kept = cube.filter((pl.col('period') >= keep_start) & (pl.col('period') < keep_end))
+    before_kept = pd.Timedelta(microseconds=1)
+
+    parts = [
+        kept,
+        compute_cube_range(data_df, sensorinfo_df, start_dt, keep_start - before_kept),
+        compute_cube_range(data_df, sensorinfo_df, keep_end, end_dt),
+    ]
+    new_sensors = sorted(set(data_df.columns) - {'datetime'} - set(kept['sensor_id'].unique().to_list()))
+    if new_sensors:
+        parts.append(compute_cube_range(data_df, sensorinfo_df, keep_start, keep_end - before_kept, columns=new_sensors))
+    return pl.concat(parts).sort(['sensor_id', 'period'])
+
+def compute_cube_range(data_df, sensorinfo_df, start_dt, end_dt, columns=None):
+    """
+    Cube rows of the periods from start_dt to end_dt. The data within OUTLIER_MARGIN around
+    the range is read as well, for the rolling window of the outliers of its first and last rows.
+    """
+    data_range = data_time_range(data_df, start_dt - OUTLIER_MARGIN, end_dt + OUTLIER_MARGIN, columns)
+    return compute_availability_cube(data_range, sensorinfo_df).filter(
+        (pl.col('period') >= pd.Timestamp(start_dt).floor(CUBE_EVERY)) & (pl.col('period') <= end_dt)
+    )
+
+def data_time_range(data_df, start_dt, end_dt, columns=None):
+    """data_df between start_dt and end_dt as LazyData, only that range is read from Parquet."""
+    data_lf = data_df.lazy().filter((pl.col('datetime') >= start_dt) & (pl.col('datetime') <= end_dt))
+    if columns is not None:
+        data_lf = data_lf.select(['datetime'] + list(columns))
+    return LazyData(data_lf)
@@ -0,0 +1,63 @@
+import os
+import json
+import hashlib
+import pandas as pd
+
+def hash_check_table(check_table):
+    """
+    Return a stable sha256 hash of a check table (pandas or Polars).
+    Column order, row order and surrounding whitespace do not change the hash.
+    """
+    if hasattr(check_table, 'to_pandas'):  # It's Polars
+        check_table = check_table.to_pandas()
+
+    # Normalise: strip strings, empty values as '', sorted columns and rows
+    normalised = check_table.copy()
+    normalised.columns = [str(col).strip() for col in normalised.columns]
+    normalised = normalised[sorted(normalised.columns)]
+    normalised = normalised.astype(object).where(pd.notna(normalised), '')
+    normalised = normalised.map(lambda x: x.strip() if isinstance(x, str) else str(x))
+    normalised = normalised.sort_values(list(normalised.columns)).reset_index(drop=True)
+
+    return hashlib.sha256(normalised.to_csv(index=False).encode('utf-8')).hexdigest()
+
+def get_sensor_keys(sensorinfo_df):
+    """Sorted list of '<source>:<sensor_id>' strings of a sensorinfo DataFrame."""
+    if sensorinfo_df is None or sensorinfo_df.height == 0:
+        return []
+    return sorted(
+        f"{source}:{sensor_id}"
+        for source, sensor_id in zip(sensorinfo_df['source'].to_list(), sensorinfo_df['sensor_id'].to_list())
+    )
+
+def make_cache_key(check_table, start_dt, end_dt):
+    """
+    Cache key of a download: sha256 over the normalised check table and the window bounds.
+    The resolved sensor ids are kept in the manifest, so the key needs no database lookup.
+    """
+    content = {
+        'check_table': hash_check_table(check_table),
+        'start_dt': pd.Timestamp(start_dt).isoformat(),
+        'end_dt': pd.Timestamp(end_dt).isoformat(),
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+
+def read_manifest(manifest_file):
+    """Read the manifest JSON, returns an empty dict if it does not exist or is unreadable."""
+    if not os.path.exists(manifest_file):
+        return {}
+    try:
+        with open(manifest_file, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError) as error:
+        print(f"Could not read manifest {manifest_file}: {error}")
+        return {}
+
+def write_manifest(manifest_file, cache_key, **info):
+    """Write the manifest JSON with the cache key and extra info, via a temporary file."""
+    os.makedirs(os.path.dirname(manifest_file) or '.', exist_ok=True)
+    manifest = {'cache_key': cache_key, **info}
+    tmp_file = manifest_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(manifest, f, indent=2, default=str)
+    os.replace(tmp_file, manifest_file)
@@ -0,0 +1,113 @@
+import polars as pl
+
+# Candidate sampling intervals in minutes, coarsest first
+CADENCES = {'1h': 60, '30min': 30, '10min': 10, '1min': 1}
+IRREGULAR = 'irregular'
+CADENCE_SCHEMA = {'sensor_id': pl.Utf8, 'cadence': pl.Utf8, 'cadence_minutes': pl.Int64}
+
+def grid_mask(minutes):
+    """Expression that is True for the datetimes on the grid of a sampling interval in minutes."""
+    on_minute = pl.col('datetime') == pl.col('datetime').dt.truncate('1m')
+    if minutes is None:
+        return pl.lit(True)
+    if minutes == 1:
+        return on_minute
+    return on_minute & (pl.col('datetime').dt.minute() % minutes == 0)
+
+def grid_column(minutes):
+    """Name of the helper column holding grid_mask(minutes), see with_grid_columns."""
+    return f'__grid_{minutes}'
+
+def with_grid_columns(data_lf, minutes_list):
+    """
+    Add the grid masks as boolean columns, so they are computed once instead of once
+    per sensor column in the filters of a wide aggregation.
+    """
+    return data_lf.with_columns([
+        grid_mask(minutes).alias(grid_column(minutes)) for minutes in dict.fromkeys(minutes_list)
+    ])
+
+def reshape_counts(counts, stats):
+    """
+    Reshape a single row of per-column counts named '<column>|<stat>' to one row
+    per column: a Polars DataFrame with sensor_id and the columns in stats.
+    """
+    return (
+        counts.unpivot()
+        .with_columns(pl.col('variable').str.split_exact('|', 1).alias('parts'))
+        .unnest('parts')
+        .rename({'field_0': 'sensor_id', 'field_1': 'stat'})
+        .pivot(on='stat', index='sensor_id', values='value')
+        .select(['sensor_id'] + list(stats))
+    )
+
+def infer_cadence(data_df, sensor_ids):
+    """
+    Sampling interval of each sensor, from the timestamps of its non-null values:
+    the coarsest of CADENCES whose grid contains all of them, else 'irregular'.
+    Sensors without data get None. Returns a Polars DataFrame with sensor_id,
+    cadence and cadence_minutes (null for irregular sensors).
+    """
+    data_columns = set(data_df.columns)
+    columns = [str(sid) for sid in dict.fromkeys(sensor_ids) if str(sid) in data_columns]
+    if len(columns) == 0:
+        return pl.DataFrame(schema=CADENCE_SCHEMA)
+
+    # Number of values off the grid of each candidate interval, all in one pass
+    data_lf = with_grid_columns(data_df.lazy(), CADENCES.values())
+    counts = data_lf.select(
+        [pl.col(columns).count().name.suffix('|n_valid')]
+        + [
+            pl.col(columns).filter(~pl.col(grid_column(minutes))).count().name.suffix(f'|{name}')
+            for name, minutes in CADENCES.items()
+        ]
+    ).collect()
+    counts = reshape_counts(counts, ['n_valid'] + list(CADENCES))
+
+    cadence = pl.when(pl.col('n_valid') == 0).then(pl.lit(None, dtype=pl.Utf8))
+    cadence_minutes = pl.when(pl.col('n_valid') == 0).then(pl.lit(None, dtype=pl.Int64))
+    for name, minutes in CADENCES.items():
+        cadence = cadence.when(pl.col(name) == 0).then(pl.lit(name))
+        cadence_minutes = cadence_minutes.when(pl.col(name) == 0).then(pl.lit(minutes))
+    return counts.select(
+        'sensor_id',
+        cadence.otherwise(pl.lit(IRREGULAR)).alias('cadence'),
+        cadence_minutes.otherwise(pl.lit(None, dtype=pl.Int64)).alias('cadence_minutes'),
+    )
+
+def add_cadence_to_sensorinfo(sensorinfo_df, data_df, known_df=None):
+    """
+    Add the cadence and cadence_minutes of every sensor to sensorinfo_df.
+    Sensors with a cadence in known_df (e.g. the saved sensorinfo) keep it, only the
+    other sensors are inferred from data_df, so their columns are the only ones read.
+    """
+    if sensorinfo_df is None or sensorinfo_df.height == 0:
+        return sensorinfo_df
+    known = pl.DataFrame(schema=CADENCE_SCHEMA)
+    if known_df is not None and 'cadence' in known_df.columns:
+        known = (
+            known_df.select(list(CADENCE_SCHEMA))
+            .cast(CADENCE_SCHEMA)
+            .filter(pl.col('cadence').is_not_null())
+            .unique(subset='sensor_id', keep='last')
+        )
+    known_ids = set(known['sensor_id'].to_list())
+    unknown = [sid for sid in sensorinfo_df['sensor_id'].cast(pl.Utf8).to_list() if sid not in known_ids]
+    cadence_df = known
+    if unknown and data_df is not None and len(data_df.columns) > 0:
+        cadence_df = pl.concat([known, infer_cadence(data_df, unknown)])
+    sensorinfo_df = sensorinfo_df.drop(['cadence', 'cadence_minutes'], strict=False)
+    return sensorinfo_df.join(
+        cadence_df.with_columns(pl.col('sensor_id').cast(sensorinfo_df.schema['sensor_id'])),
+        on='sensor_id',
+        how='left'
+    )
+
+def get_cadence_minutes(sensorinfo_df):
+    """Dictionary of sensor_id (str) to cadence in minutes, None for irregular or unknown."""
+    if sensorinfo_df is None or 'cadence_minutes' not in sensorinfo_df.columns:
+        return {}
+    return dict(zip(
+        sensorinfo_df['sensor_id'].cast(pl.Utf8).to_list(),
+        sensorinfo_df['cadence_minutes'].to_list()
+    ))
@@ -3,7 +3,14 @@ from dash import html, Input, Output, State, ctx, dcc, clientside_callback
 import dash_bootstrap_components as dbc
 import pandas as pd
 from dash_bootstrap_templates import ThemeChangerAIO
-from .timeline_plot import create_timeline_plot, create_multi_timeline_plot
+from .timeline_plot import (
+    create_timeline_plot,
+    create_multi_timeline_plot,
+    get_relayout_x_range,
+    patch_multi_timeline_plot,
+    resample_timeline_traces
+)
+from .trace_cache import TraceCache
 
 # Define theme configurations
 LIGHT_THEME = {
@@ -47,8 +54,15 @@ def get_plotly_theme(is_dark=False):
     }
 
 
-def register_callbacks(app, pivot_table, check_table, nan_table, data_df):
-    """Register all callbacks for the data availability table application"""
+def register_callbacks(app, pivot_table, check_table, nan_table, data_df, pyramid=None, cadences=None):
+    """
+    Register all callbacks for the data availability table application.
+    The timeline reads from the aggregation pyramid of data_df when one is given, gaps in
+    the raw data are measured in the sampling interval of each sensor from cadences
+    (sensor_id to minutes, see get_cadence_minutes in src/cadence.py).
+    """
+    # Downsampled plot data per sensor, window and resolution, shared by all timeline callbacks
+    trace_cache = TraceCache()
     
     # Cell selection callback
     @app.callback(
@@ -105,16 +119,30 @@ def register_callbacks(app, pivot_table, check_table, nan_table, data_df):
         Output('django-theme-store', 'data'),
         [Input('selected-cells-store', 'data')]
     )
+
+    # Width available for the timeline graph, the traces are downsampled to it
+    app.clientside_callback(
+        """
+        function(selected_cells) {
+            return window.innerWidth;
+        }
+        """,
+        Output('graph-width-store', 'data'),
+        [Input('selected-cells-store', 'data')]
+    )
     
     @app.callback(
         [Output('selection-info', 'children'),
          Output('selection-info', 'style'),
          Output('timeline-graph', 'figure'),
-         Output('timeline-graph', 'style')],
+         Output('timeline-graph', 'style'),
+         Output('timeline-traces-store', 'data')],
         [Input('selected-cells-store', 'data'),
-         Input('django-theme-store', 'data')],
+         Input('django-theme-store', 'data'),
+         Input('graph-width-store', 'data')],
+        [State('timeline-traces-store', 'data')],
     )
-    def display_selection_data(selected_cells, theme_data):
+    def display_selection_data(selected_cells, theme_data, graph_width, timeline_state):
         # Get current theme - this will be updated by the clientside callback
         current_theme = theme_data if isinstance(theme_data, str) else 'light'
         
@@ -162,8 +190,30 @@ def register_callbacks(app, pivot_table, check_table, nan_table, data_df):
                 selection_info.append(html.P(f"  ... showing last 5 of {cell_count} selected", 
                                            className="mb-1", style={"marginLeft": "20px", "fontStyle": "italic"}))
             
-            # Create multi-timeline plot for all selected cells
-            timeline_fig = create_multi_timeline_plot(data_df, selected_cells, check_table, nan_table, current_theme)
+            # If one cell was toggled, only its trace is added or removed from the displayed figure
+            timeline_state = timeline_state or {}
+            patched = None
+            if timeline_state.get('theme') == current_theme and timeline_state.get('width') == graph_width:
+                patched = patch_multi_timeline_plot(
+                    data_df, selected_cells, check_table, nan_table, timeline_state,
+                    width=graph_width, pyramid=pyramid, cache=trace_cache, cadences=cadences
+                )
+            if patched is not None:
+                timeline_fig, cells, trace_sensor_ids = patched
+                timeline_state = dict(timeline_state, cells=cells, sensor_ids=trace_sensor_ids)
+            else:
+                # Create multi-timeline plot for all selected cells
+                timeline_fig = create_multi_timeline_plot(
+                    data_df, selected_cells, check_table, nan_table, current_theme,
+                    width=graph_width, pyramid=pyramid, cache=trace_cache, cadences=cadences
+                )
+                timeline_state = {
+                    'cells': [trace.meta['cell'] for trace in timeline_fig.data],
+                    'sensor_ids': [trace.meta['sensor_id'] for trace in timeline_fig.data],
+                    'x_range': None,
+                    'theme': current_theme,
+                    'width': graph_width,
+                }
             
             # Add info about the displayed timeline
             selection_info.append(html.Hr(className="my-2"))
@@ -178,10 +228,32 @@ def register_callbacks(app, pivot_table, check_table, nan_table, data_df):
                 f"{len(unique_sensors)} unique sensors from selected cells"
             ], className="mb-1", style={"color": "#007bff"}))
             
-            return selection_info, base_style, timeline_fig, visible_style
+            return selection_info, base_style, timeline_fig, visible_style, timeline_state
         
         # If no selections, show helpful message
         selection_info = [html.P("No cells selected. Use Ctrl+Click or drag to select cells in the table above.", 
                                style={"color": "#6c757d", "fontStyle": "italic"})]
                 
-        return selection_info, base_style, empty_fig, hidden_style
+        return selection_info, base_style, empty_fig, hidden_style, {}
+
+    # Re-query the visible range when zooming or panning the timeline, only the trace arrays are sent
+    @app.callback(
+        [Output('timeline-graph', 'figure', allow_duplicate=True),
+         Output('timeline-traces-store', 'data', allow_duplicate=True)],
+        Input('timeline-graph', 'relayoutData'),
+        [State('timeline-traces-store', 'data'),
+         State('graph-width-store', 'data')],
+        prevent_initial_call=True
+    )
+    def resample_timeline(relayout_data, timeline_state, graph_width):
+        x_range = get_relayout_x_range(relayout_data)
+        if x_range is None or not timeline_state or not timeline_state.get('sensor_ids'):
+            return dash.no_update, dash.no_update
+        patched = resample_timeline_traces(
+            data_df, timeline_state['sensor_ids'], *x_range,
+            width=graph_width, pyramid=pyramid, cache=trace_cache, cadences=cadences
+        )
+        # Remember the visible range, traces added later are made for it
+        patched_state = dash.Patch()
+        patched_state['x_range'] = None if x_range[0] is None else list(x_range)
+        return patched, patched_state
@@ -0,0 +1,110 @@
+import os
+import glob
+import shutil
+from datetime import datetime
+import polars as pl
+from src.coverage import to_utc
+
+# Chunk bounds in file names are UTC, so a timezone or DST change maps to the same files
+CHUNK_TIME_FORMAT = '%Y%m%dT%H%M%SZ'
+# File names written before the bounds were in UTC, in the timezone of the download window
+LEGACY_CHUNK_TIME_FORMAT = '%Y%m%dT%H%M%S'
+
+class ParquetChunkSink:
+    """
+    Writes downloaded chunks to a directory of Parquet files, one file per chunk.
+    Chunks are written as soon as they arrive, so memory is bounded by a single chunk
+    and the completed chunks survive a crash halfway a download.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def chunk_path(self, start_dt, end_dt):
+        """Path of the Parquet file for the chunk between start_dt and end_dt (named in UTC)."""
+        return os.path.join(
+            self.directory,
+            f"chunk_{to_utc(start_dt).strftime(CHUNK_TIME_FORMAT)}_{to_utc(end_dt).strftime(CHUNK_TIME_FORMAT)}.parquet"
+        )
+
+    @staticmethod
+    def chunk_bounds(path):
+        """(start, end) of a chunk file as naive UTC datetimes, parsed from its file name."""
+        parts = os.path.basename(path)[:-len('.parquet')].split('_')
+        start, end = parts[1], parts[2]
+        time_format = CHUNK_TIME_FORMAT if start.endswith('Z') else LEGACY_CHUNK_TIME_FORMAT
+        return datetime.strptime(start, time_format), datetime.strptime(end, time_format)
+
+    def has_chunk(self, start_dt, end_dt, sensorids=None):
+        """
+        Check if the chunk was already written, and contains all sensorids if given.
+        """
+        path = self.chunk_path(start_dt, end_dt)
+        if not os.path.exists(path):
+            return False
+        if sensorids is not None:
+            columns = set(pl.read_parquet_schema(path).keys())
+            if not set(str(sid) for sid in sensorids) <= columns:
+                return False
+        return True
+
+    def write_chunk(self, start_dt, end_dt, data_df):
+        """Write a chunk, via a temporary file so a crash never leaves a partial chunk."""
+        path = self.chunk_path(start_dt, end_dt)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        data_df.write_parquet(tmp_path)
+        os.replace(tmp_path, path)
+
+    def chunk_files(self, start_dt=None, end_dt=None):
+        """
+        Sorted list of the chunk files in the directory.
+        Optionally only the chunks that overlap the period between start_dt and end_dt.
+        """
+        files = sorted(glob.glob(os.path.join(self.directory, '**', 'chunk_*.parquet'), recursive=True))
+        if start_dt is None and end_dt is None:
+            return files
+        # File names hold the chunk bounds in UTC, compare without timezone
+        start_naive = to_utc(start_dt).tz_localize(None) if start_dt is not None else None
+        end_naive = to_utc(end_dt).tz_localize(None) if end_dt is not None else None
+        selected = []
+        for f in files:
+            chunk_start, chunk_end = self.chunk_bounds(f)
+            if start_naive is not None and chunk_end < start_naive:
+                continue
+            if end_naive is not None and chunk_start > end_naive:
+                continue
+            selected.append(f)
+        return selected
+
+    def scan(self, start_dt=None, end_dt=None):
+        """
+        LazyFrame over all chunks, in time order with one row per datetime.
+        Chunks of the same period with different sensors are merged per datetime,
+        for overlapping values the most recently written chunk wins.
+        Optionally limited to the period between start_dt and end_dt.
+        Returns None if no chunks were written.
+        """
+        files = self.chunk_files(start_dt, end_dt)
+        if not files:
+            return None
+        # Newest files first, so first() below takes the most recent value
+        files = sorted(files, key=os.path.getmtime, reverse=True)
+        data_lf = pl.concat([pl.scan_parquet(f) for f in files], how='diagonal_relaxed')
+        # The datetimes are stored in UTC
+        if start_dt is not None:
+            data_lf = data_lf.filter(pl.col('datetime') >= to_utc(start_dt))
+        if end_dt is not None:
+            data_lf = data_lf.filter(pl.col('datetime') <= to_utc(end_dt))
+        # Chunk boundaries are included in both neighbouring chunks, keep one row per timestamp
+        return (
+            data_lf.group_by('datetime', maintain_order=True)
+            .agg(pl.all().drop_nulls().first())
+            .sort('datetime')
+        )
+
+    def clear(self):
+        """Remove the directory with all chunks."""
+        if os.path.exists(self.directory):
+            shutil.rmtree(self.directory)
@@ -44,23 +44,21 @@ sel_names = ['PPA_42_MT', 'BRO_43_MT', 'MOB_42_MT', 'CAM_21_MT', 'ONL_22_MT']
 def correct_airpressure_units(data_df, sensorinfo_df, sensor_ids):
     """
     Multiplies the values of the given sensor_ids by 10 in data_df and updates the unit in sensorinfo_df.
+    All columns are scaled in one with_columns, so it also works on a LazyData facade.
     """
-    for sensor in sensor_ids:
-        sensor_str = str(sensor)
-        if sensor_str in data_df.columns:
-            # Update data_df using Polars
-            data_df = data_df.with_columns([
-                (pl.col(sensor_str) * 10).alias(sensor_str)
-            ])
-        
-        if 'unit' in sensorinfo_df.columns:
-            # Update sensorinfo_df using Polars
-            sensorinfo_df = sensorinfo_df.with_columns([
-                pl.when(pl.col('sensor_id') == sensor)
-                .then(pl.lit('hPa'))
-                .otherwise(pl.col('unit'))
-                .alias('unit')
-            ])
+    sensor_ids = list(dict.fromkeys(sensor_ids))
+    data_columns = set(data_df.columns)
+    columns = [str(sensor) for sensor in sensor_ids if str(sensor) in data_columns]
+    if columns:
+        data_df = data_df.with_columns(pl.col(columns) * 10)
+
+    if 'unit' in sensorinfo_df.columns:
+        sensorinfo_df = sensorinfo_df.with_columns(
+            pl.when(pl.col('sensor_id').is_in(sensor_ids))
+            .then(pl.lit('hPa'))
+            .otherwise(pl.col('unit'))
+            .alias('unit')
+        )
     return data_df, sensorinfo_df
 
 def find_incorrect_airpressure_sensors(sensorinfo_df, data_df, threshold=200):
@@ -68,26 +66,33 @@ def find_incorrect_airpressure_sensors(sensorinfo_df, data_df, threshold=200):
     Returns a list of sensor_ids where air pressure values are likely a factor 10 too low.
     Also checks the unit in sensorinfo_df if available.
     """
-    # Find air pressure sensors using Polars
-    airpressure_sensors = sensorinfo_df.filter(
+    # Air pressure sensors that have a column in data_df
+    data_columns = set(data_df.columns)
+    airpressure_df = sensorinfo_df.filter(
         pl.col('variable_name').str.contains('PAIR')
-    )['sensor_id'].to_list()
-    
-    incorrect_sensors = []
-    for sensor in airpressure_sensors:
-        sensor_str = str(sensor)
-        if sensor_str in data_df.columns:
-            # Get values using Polars
-            vals = data_df.select(sensor_str).to_series().drop_nulls()
-            
-            # Check for low median or wrong unit
-            sensor_info = sensorinfo_df.filter(pl.col('sensor_id') == sensor)
-            if sensor_info.height > 0 and 'unit' in sensorinfo_df.columns:
-                unit = sensor_info['unit'].item()
-            else:
-                unit = 'hPa'
-                
-            if (vals.len() > 0 and vals.median() < threshold) or (unit not in ['hPa', 'hpa']):
-                incorrect_sensors.append(sensor)
-    return incorrect_sensors
+        & pl.col('sensor_id').cast(pl.Utf8).is_in(list(data_columns))
+    )
+    if airpressure_df.height == 0:
+        return []
+    if 'unit' not in airpressure_df.columns:
+        airpressure_df = airpressure_df.with_columns(pl.lit('hPa').alias('unit'))
 
+    # Medians of all air pressure columns in one pass
+    columns = list(dict.fromkeys(airpressure_df['sensor_id'].cast(pl.Utf8).to_list()))
+    medians = data_df.select(pl.col(columns).median().cast(pl.Float64)).row(0)
+    median_df = pl.DataFrame(
+        {'sensor_str': columns, 'median': medians},
+        schema={'sensor_str': pl.Utf8, 'median': pl.Float64}
+    )
+
+    # Low median or wrong unit
+    return (
+        airpressure_df.with_columns(pl.col('sensor_id').cast(pl.Utf8).alias('sensor_str'))
+        .join(median_df, on='sensor_str', how='left')
+        .filter(
+            (pl.col('median') < threshold).fill_null(False)
+            | ~pl.col('unit').is_in(['hPa', 'hpa']).fill_null(False)
+        )
+        .unique(subset='sensor_id', keep='first', maintain_order=True)
+        ['sensor_id'].to_list()
+    )
@@ -0,0 +1,120 @@
+import os
+import json
+import threading
+from datetime import timedelta
+import pandas as pd
+
+def merge_intervals(intervals):
+    """Merge overlapping or touching (start, end) intervals, returns a sorted list."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def subtract_intervals(start_dt, end_dt, covered):
+    """Parts of the period between start_dt and end_dt that are not in the (merged) covered intervals."""
+    gaps = []
+    current = start_dt
+    for cov_start, cov_end in covered:
+        if cov_end <= current:
+            continue
+        if cov_start >= end_dt:
+            break
+        if cov_start > current:
+            gaps.append((current, cov_start))
+        current = max(current, cov_end)
+    if current < end_dt:
+        gaps.append((current, end_dt))
+    return gaps
+
+def to_utc(dt):
+    """Timestamp in UTC, naive datetimes are taken as UTC."""
+    dt = pd.Timestamp(dt)
+    if dt.tzinfo is None:
+        return dt.tz_localize('UTC')
+    return dt.tz_convert('UTC')
+
+class CoverageIndex:
+    """
+    Per-sensor index of the time intervals that were fetched from the database, and when.
+    Stored as JSON: {sensor_id: [[start, end, fetched_at], ...]}.
+    Data is only counted as covered up to fetched_at - settle_time, as the database may
+    still fill in the most recent data.
+    """
+
+    def __init__(self, path, settle_time=timedelta(days=1)):
+        self.path = path
+        self.settle_time = settle_time
+        self._lock = threading.Lock()
+        self.index = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.index = json.load(f)
+
+    def covered(self, sensor_id):
+        """Merged list of covered (start, end) intervals of a sensor, as UTC timestamps."""
+        intervals = [
+            (pd.Timestamp(start), pd.Timestamp(end))
+            for start, end, _ in self.index.get(str(sensor_id), [])
+        ]
+        return merge_intervals(intervals)
+
+    def missing(self, sensor_ids, start_dt, end_dt):
+        """Dictionary of sensor_id to the list of (start, end) gaps in the requested period."""
+        start_dt = to_utc(start_dt)
+        end_dt = to_utc(end_dt)
+        missing = {}
+        for sensor_id in sensor_ids:
+            gaps = subtract_intervals(start_dt, end_dt, self.covered(sensor_id))
+            if gaps:
+                missing[sensor_id] = gaps
+        return missing
+
+    @staticmethod
+    def group_missing(missing):
+        """
+        Coalesce the gaps of all sensors into queries.
+        Returns a list of ((start, end), [sensor_ids]), one entry per distinct gap
+        with all sensors that miss exactly that gap.
+        """
+        groups = {}
+        for sensor_id, gaps in missing.items():
+            for gap in gaps:
+                groups.setdefault(gap, []).append(sensor_id)
+        return sorted(groups.items())
+
+    def add(self, sensor_ids, start_dt, end_dt, fetched_at=None):
+        """Mark the period between start_dt and end_dt as fetched for sensor_ids and save the index."""
+        if fetched_at is None:
+            fetched_at = pd.Timestamp.now(tz='UTC')
+        start_dt = to_utc(start_dt)
+        # Only the part that had settled when it was fetched counts as covered
+        end_dt = min(to_utc(end_dt), fetched_at - self.settle_time)
+        if end_dt <= start_dt:
+            return
+
+        with self._lock:
+            for sensor_id in sensor_ids:
+                entries = self.index.setdefault(str(sensor_id), [])
+                entries.append([start_dt.isoformat(), end_dt.isoformat(), fetched_at.isoformat()])
+                # Merge overlapping entries, keep the latest fetch time
+                merged = []
+                for start, end, fetched in sorted(entries):
+                    if merged and pd.Timestamp(start) <= pd.Timestamp(merged[-1][1]):
+                        merged[-1][1] = max(merged[-1][1], end, key=pd.Timestamp)
+                        merged[-1][2] = max(merged[-1][2], fetched, key=pd.Timestamp)
+                    else:
+                        merged.append([start, end, fetched])
+                self.index[str(sensor_id)] = merged
+            self.save()
+
+    def save(self):
+        """Write the index, via a temporary file so a crash never leaves a partial index."""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.path)
@@ -1,29 +1,128 @@
 from get_dbstring import get_dbstring
 from config import load_config
 
+import os
+import atexit
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from src.general import get_check_table
+from src.chunk_sink import ParquetChunkSink
+from src.sensorinfo_cache import SENSORINFO_CACHE_TTL, load_cached_sensorinfo, save_cached_sensorinfo
 import polars as pl
 from sqlalchemy import create_engine, Engine
 from urllib.parse import quote  
 
-def get_engine(config: dict, config_file='database.ini', config_section='postgresql_wur') -> Engine:
-    config = load_config(filename='database.ini', section=config_section)
-
-    """Create a SQLAlchemy engine."""
-    # db_url = f"postgresql://{configg['user']}:{configg['password']}@{configg['host']}:{configg['port']}/{configg['database']}"
+# Pool settings for the cached engines, can be overridden with configure_engines()
+ENGINE_POOL_SIZE = 5
+ENGINE_MAX_OVERFLOW = 5
+ENGINE_POOL_RECYCLE = 1800  # seconds
+ENGINE_POOL_PRE_PING = True
+
+# Maximum number of concurrent chunk queries per source, to avoid overloading the database servers
+MAX_CONCURRENCY = {
+    'wur_db': 4,
+    'vu_db': 2,
+}
+
+# Number of retries and base delay (seconds) for a failed chunk
+CHUNK_RETRIES = 2
+CHUNK_RETRY_DELAY = 5
+
+# Engines to transfer query results:
+#   'sqlalchemy': pl.read_database over the pooled SQLAlchemy connection (row tuples)
+#   'connectorx': Arrow-native, uses the binary COPY protocol of Postgres (pip install connectorx)
+#   'adbc': Arrow-native ADBC driver (pip install adbc-driver-postgresql)
+FETCH_ENGINES = ('sqlalchemy', 'connectorx', 'adbc')
+DEFAULT_FETCH_ENGINE = 'sqlalchemy'
+
+# Process-wide registry of engines, keyed by (config_file, config_section)
+_engines = {}
+_engines_lock = threading.Lock()
+
+def configure_engines(pool_size=None, max_overflow=None, pool_recycle=None, pool_pre_ping=None):
+    """
+    Change the pool settings used for new engines.
+    Engines that already exist are disposed so the new settings take effect on the next query.
+    """
+    global ENGINE_POOL_SIZE, ENGINE_MAX_OVERFLOW, ENGINE_POOL_RECYCLE, ENGINE_POOL_PRE_PING
+    if pool_size is not None:
+        ENGINE_POOL_SIZE = pool_size
+    if max_overflow is not None:
+        ENGINE_MAX_OVERFLOW = max_overflow
+    if pool_recycle is not None:
+        ENGINE_POOL_RECYCLE = pool_recycle
+    if pool_pre_ping is not None:
+        ENGINE_POOL_PRE_PING = pool_pre_ping
+    dispose_engines()
+
+def get_db_url(config_file='database.ini', config_section='postgresql_wur') -> str:
+    """Build the database URL for a section of the config file."""
+    config = load_config(filename=config_file, section=config_section)
     db_url = f"postgresql://{config['user']}:%s@{config['host']}:{config['port']}/{config['database']}"
-    engine = create_engine(db_url % quote(config['password']))
-    # engine = create_engine(db_url)
+    return db_url % quote(config['password'])
+
+def get_engine(config: dict = None, config_file='database.ini', config_section='postgresql_wur') -> Engine:
+    """
+    Return the pooled SQLAlchemy engine for a config section.
+    The engine is created once per (config_file, config_section) and reused by all queries.
+    """
+    key = (config_file, config_section)
+    engine = _engines.get(key)
+    if engine is not None:
+        return engine
+
+    with _engines_lock:
+        # Another thread may have created the engine while we were waiting
+        engine = _engines.get(key)
+        if engine is None:
+            engine = create_engine(
+                get_db_url(config_file=config_file, config_section=config_section),
+                pool_size=ENGINE_POOL_SIZE,
+                max_overflow=ENGINE_MAX_OVERFLOW,
+                pool_recycle=ENGINE_POOL_RECYCLE,
+                pool_pre_ping=ENGINE_POOL_PRE_PING,
+            )
+            _engines[key] = engine
     return engine
 
-def run_pg_query(query: str, config_file='database.ini', config_section='postgresql_wur',params=None, **kwargs) -> pl.DataFrame:
-    """Execute a SQL query and read the results using polars."""
-    try:
-        config = load_config(filename=config_file, section=config_section)
+def dispose_engines():
+    """Close all pooled connections and clear the engine registry."""
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+# Make sure pooled connections are closed when the process shuts down
+atexit.register(dispose_engines)
 
-        # Create a SQLAlchemy engine
-        engine = get_engine(config=config, config_section=config_section)
+def run_pg_query(query: str, config_file='database.ini', config_section='postgresql_wur',params=None, raise_on_error=False, fetch_engine=None, **kwargs) -> pl.DataFrame:
+    """
+    Execute a SQL query and read the results using polars.
+    fetch_engine selects how the rows are transferred (see FETCH_ENGINES), the default
+    is DEFAULT_FETCH_ENGINE. If an Arrow-native engine is not installed or fails,
+    the query is retried over the SQLAlchemy connection.
+    By default errors are printed and an empty DataFrame is returned, set raise_on_error=True to re-raise them.
+    """
+    if fetch_engine is None:
+        fetch_engine = DEFAULT_FETCH_ENGINE
+    if fetch_engine not in FETCH_ENGINES:
+        raise ValueError(f"Unknown fetch_engine: {fetch_engine}. Supported engines are {FETCH_ENGINES}.")
+
+    if fetch_engine != 'sqlalchemy':
+        try:
+            # Arrow-native transfer straight into Polars buffers
+            uri = get_db_url(config_file=config_file, config_section=config_section)
+            return pl.read_database_uri(query, uri=uri, engine=fetch_engine)
+        except ImportError as error:
+            print(f"Fetch engine '{fetch_engine}' not available ({error}), falling back to sqlalchemy")
+        except Exception as error:
+            print(f"Fetch engine '{fetch_engine}' failed ({error}), falling back to sqlalchemy")
+
+    try:
+        # Get the pooled SQLAlchemy engine for this config section
+        engine = get_engine(config_file=config_file, config_section=config_section)
 
         # Execute the query
         df = pl.read_database(query, connection=engine, **kwargs)
@@ -32,11 +131,20 @@ def run_pg_query(query: str, config_file='database.ini', config_section='postgre
 
     except Exception as error:
         print(f"Error: {error}")
+        if raise_on_error:
+            raise
         return pl.DataFrame()
     
-def get_data_from_db(start_dt=None, end_dt=None, check_table_filename='check_table.csv'):
+def get_data_from_db(start_dt=None, end_dt=None, check_table_filename='check_table.csv', cache_dir=None, server_dedup=False, fetch_engine=None, chunk_dir=None, store=None, on_chunk=None):
     """
     Function to retrieve data from the WUR and VU databases.
+    Both sources are downloaded at the same time and joined on datetime.
+    When chunk_dir is given the chunks are streamed to Parquet files in chunk_dir/<source>
+    and data_df is returned as a LazyFrame over these files.
+    When a PartitionStore is given only the sensors and periods missing from its coverage
+    index are downloaded, and data_df is a LazyFrame over the stored window.
+    on_chunk is called with every downloaded chunk of both sources (see
+    get_sensor_data_in_chunks), from the download thread of each source.
     """
     
     # Get the variables_table
@@ -47,12 +155,32 @@ def get_data_from_db(start_dt=None, end_dt=None, check_table_filename='check_tab
     data_df_vu = pl.DataFrame()
     sensorinfo_df_wur = pl.DataFrame()
     data_df_wur = pl.DataFrame()
-    
-    # Get data from the database
-    sensorinfo_df_wur, data_df_wur = get_data_in_chunks(check_table[check_table['source'] == 'wur_db'], start_dt, end_dt, source='wur_db')
-    
-    # Get data from the database
-    sensorinfo_df_vu, data_df_vu = get_data_in_chunks(check_table[check_table['source'] == 'vu_db'], start_dt, end_dt, source='vu_db')
+
+    # Stream the chunks to disk per source if requested
+    if store is not None:
+        # Bring the store up to date for both sources concurrently
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            future_wur = executor.submit(get_data_in_store, check_table[check_table['source'] == 'wur_db'], start_dt, end_dt, store, source='wur_db', cache_dir=cache_dir, server_dedup=server_dedup, fetch_engine=fetch_engine, on_chunk=on_chunk)
+            future_vu = executor.submit(get_data_in_store, check_table[check_table['source'] == 'vu_db'], start_dt, end_dt, store, source='vu_db', cache_dir=cache_dir, server_dedup=server_dedup, fetch_engine=fetch_engine, on_chunk=on_chunk)
+            sensorinfo_df_wur, data_df_wur = future_wur.result()
+            sensorinfo_df_vu, data_df_vu = future_vu.result()
+        return combine_sensorinfo(sensorinfo_df_wur, sensorinfo_df_vu), join_lazy_sources(data_df_wur, data_df_vu)
+    elif chunk_dir is not None:
+        sink_wur = ParquetChunkSink(os.path.join(chunk_dir, 'wur_db'))
+        sink_vu = ParquetChunkSink(os.path.join(chunk_dir, 'vu_db'))
+    else:
+        sink_wur, sink_vu = None, None
+
+    # Get data from both databases concurrently, they are separate servers
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        future_wur = executor.submit(get_data_in_chunks, check_table[check_table['source'] == 'wur_db'], start_dt, end_dt, source='wur_db', cache_dir=cache_dir, server_dedup=server_dedup, fetch_engine=fetch_engine, sink=sink_wur, on_chunk=on_chunk)
+        future_vu = executor.submit(get_data_in_chunks, check_table[check_table['source'] == 'vu_db'], start_dt, end_dt, source='vu_db', cache_dir=cache_dir, server_dedup=server_dedup, fetch_engine=fetch_engine, sink=sink_vu, on_chunk=on_chunk)
+        sensorinfo_df_wur, data_df_wur = future_wur.result()
+        sensorinfo_df_vu, data_df_vu = future_vu.result()
+
+    if chunk_dir is not None:
+        # Join the chunk files lazily, nothing is loaded yet
+        return combine_sensorinfo(sensorinfo_df_wur, sensorinfo_df_vu), join_lazy_sources(data_df_wur, data_df_vu)
 
     # Check if data_df_wur and data_df_vu are None or empty
     if data_df_wur is None or data_df_wur.height == 0:
@@ -72,6 +200,21 @@ def get_data_from_db(start_dt=None, end_dt=None, check_table_filename='check_tab
         data_df = data_df_vu
     else:
         data_df = pl.DataFrame()
+
+    return combine_sensorinfo(sensorinfo_df_wur, sensorinfo_df_vu), data_df
+
+def join_lazy_sources(data_lf_wur, data_lf_vu):
+    """Join the LazyFrames of the WUR and VU database on datetime, either may be None."""
+    data_lfs = [data_lf for data_lf in [data_lf_wur, data_lf_vu] if isinstance(data_lf, pl.LazyFrame)]
+    if len(data_lfs) == 2:
+        return data_lfs[0].join(data_lfs[1], on='datetime', how='full', coalesce=True).sort('datetime')
+    elif len(data_lfs) == 1:
+        return data_lfs[0]
+    print("No data found for WUR and VU database.")
+    return pl.LazyFrame()
+
+def combine_sensorinfo(sensorinfo_df_wur, sensorinfo_df_vu):
+    """Combine the sensorinfo of the WUR and VU database on their common columns."""
     
     # Check if sensorinfo_df_wur and sensorinfo_df_vu are None or empty
     if sensorinfo_df_wur is None or sensorinfo_df_wur.height == 0:
@@ -96,7 +239,17 @@ def get_data_from_db(start_dt=None, end_dt=None, check_table_filename='check_tab
     else:
         sensorinfo_df = pl.DataFrame()
 
-    return sensorinfo_df, data_df
+    return sensorinfo_df
+
+def get_sensorinfo_from_db(check_table_filename='check_table.csv', cache_dir=None):
+    """
+    Resolve the sensors of both databases without downloading data.
+    With a cache_dir this is a local lookup as long as the cached sensorinfo is valid.
+    """
+    check_table = get_check_table(filename=check_table_filename)
+    sensorinfo_df_wur = get_sensorinfo(check_table[check_table['source'] == 'wur_db'], source='wur_db', cache_dir=cache_dir)
+    sensorinfo_df_vu = get_sensorinfo(check_table[check_table['source'] == 'vu_db'], source='vu_db', cache_dir=cache_dir)
+    return combine_sensorinfo(sensorinfo_df_wur, sensorinfo_df_vu)
 
 def get_sensorinfo_wur(shortname):
     
@@ -170,8 +323,20 @@ def get_sensorinfo_siteid_name_combo_vu(siteid_names_combo):
 
     return sensor_info
 
-def get_data_vudb(sensorid, start_dt, end_dt, limit=None):
-    
+# Data table, time column and sensor id column per source
+DATA_TABLES = {
+    'vu_db': ('cdr.pointdata', 'dt', 'logicid'),
+    'wur_db': ('sensor_data', 'time', 'sensor_id'),
+}
+
+def build_data_query(source, sensorid, start_dt, end_dt, limit=None, server_dedup=False):
+    """
+    Build the query returning (dt, logicid, value) rows for a source.
+    With server_dedup=True duplicate (dt, logicid) rows are removed in the database with
+    DISTINCT ON, so only one row per timestamp and sensor is transferred.
+    """
+    table, time_col, id_col = DATA_TABLES[source]
+
     sensorid_db_string = get_dbstring(sensorid)      
 
     # Check if start_dt and end_dt are datetime objects, if convert to strings take timezone into account
@@ -179,30 +344,51 @@ def get_data_vudb(sensorid, start_dt, end_dt, limit=None):
         start_dt = start_dt.strftime('%Y-%m-%d %H:%M:%S%z')
     if isinstance(end_dt, datetime):
         end_dt = end_dt.strftime('%Y-%m-%d %H:%M:%S%z')
- 
-    if limit is None:
-        query = f"""
-        SELECT dt, logicid, value
-        FROM cdr.pointdata
-        WHERE logicid IN ({sensorid_db_string})
-        AND dt BETWEEN '{start_dt}' AND '{end_dt}'
-        """
+
+    if server_dedup:
+        select = f"SELECT DISTINCT ON ({time_col}, {id_col}) {time_col} AS dt, {id_col} AS logicid, value"
     else:
-        query = f"""
-        SELECT dt, logicid, value
-        FROM cdr.pointdata
-        WHERE logicid IN ({sensorid_db_string})
-        AND dt BETWEEN '{start_dt}' AND '{end_dt}'
-        LIMIT {limit}
+        select = f"SELECT {time_col} AS dt, {id_col} AS logicid, value"
+
+    query = f"""
+        {select}
+        FROM {table}
+        WHERE {id_col} IN ({sensorid_db_string})
+        AND {time_col} BETWEEN '{start_dt}' AND '{end_dt}'
         """
+    if server_dedup:
+        # DISTINCT ON requires the ORDER BY to start with the distinct columns
+        query += f"ORDER BY {time_col}, {id_col}\n"
+    if limit is not None:
+        query += f"LIMIT {limit}\n"
 
-    result = run_pg_query(query, config_section='postgresql_vu')
+    return query
+
+def get_data_vudb(sensorid, start_dt, end_dt, limit=None, raise_on_error=False, server_dedup=False, fetch_engine=None):
+    
+    query = build_data_query('vu_db', sensorid, start_dt, end_dt, limit=limit, server_dedup=server_dedup)
+
+    result = run_pg_query(query, config_section='postgresql_vu', raise_on_error=raise_on_error, fetch_engine=fetch_engine)
 
     return result
 
-def get_data_wurdb(sensorid, start_dt, end_dt, limit=None):
+def get_data_wurdb(sensorid, start_dt, end_dt, limit=None, raise_on_error=False, server_dedup=False, fetch_engine=None):
     
-    sensorid_db_string = get_dbstring(sensorid)      
+    query = build_data_query('wur_db', sensorid, start_dt, end_dt, limit=limit, server_dedup=server_dedup)
+
+    result = run_pg_query(query, config_section='postgresql_wur', raise_on_error=raise_on_error, fetch_engine=fetch_engine)
+
+    return result
+       
+def build_keyset_query(source, sensorid, start_dt, end_dt, page_size=100000, after=None):
+    """
+    Build a keyset-paginated data query ordered by (dt, logicid).
+    after is the (dt, logicid) key of the last row of the previous page, rows up to
+    and including that key are skipped.
+    """
+    table, time_col, id_col = DATA_TABLES[source]
+
+    sensorid_db_string = get_dbstring(sensorid)
 
     # Check if start_dt and end_dt are datetime objects, if convert to strings take timezone into account
     if isinstance(start_dt, datetime):
@@ -210,26 +396,59 @@ def get_data_wurdb(sensorid, start_dt, end_dt, limit=None):
     if isinstance(end_dt, datetime):
         end_dt = end_dt.strftime('%Y-%m-%d %H:%M:%S%z')
 
-    if limit is None:     
-        query = f"""
-        SELECT time AS dt, sensor_id AS logicid, value
-        FROM sensor_data
-        WHERE sensor_id IN ({sensorid_db_string})
-        AND time BETWEEN '{start_dt}' AND '{end_dt}'
-        """
-    else:
-        query = f"""
-        SELECT time AS dt, sensor_id AS logicid, value
-        FROM sensor_data
-        WHERE sensor_id IN ({sensorid_db_string})
-        AND time BETWEEN '{start_dt}' AND '{end_dt}'
-        LIMIT {limit}
+    query = f"""
+        SELECT {time_col} AS dt, {id_col} AS logicid, value
+        FROM {table}
+        WHERE {id_col} IN ({sensorid_db_string})
+        AND {time_col} BETWEEN '{start_dt}' AND '{end_dt}'
         """
+    if after is not None:
+        last_dt, last_id = after
+        if isinstance(last_dt, datetime):
+            last_dt = last_dt.strftime('%Y-%m-%d %H:%M:%S.%f%z')
+        if not isinstance(last_id, int):
+            last_id = f"'{last_id}'"
+        query += f"AND ({time_col}, {id_col}) > ('{last_dt}', {last_id})\n"
+    query += f"ORDER BY {time_col}, {id_col}\nLIMIT {page_size}\n"
+
+    return query
+
+def iter_data_pages(sensorids, start_dt, end_dt, source='wur_db', page_size=100000, fetch_engine=None):
+    """
+    Generator of long (dt, logicid, value) pages ordered by (dt, logicid).
+    Each page resumes after the last key of the previous page, so no rows are
+    skipped or repeated at page boundaries and only one page is held in memory.
+    """
+    config_section = 'postgresql_vu' if source == 'vu_db' else 'postgresql_wur'
+    after = None
+    while True:
+        query = build_keyset_query(source, sensorids, start_dt, end_dt, page_size=page_size, after=after)
+        page = run_pg_query(query, config_section=config_section, raise_on_error=True, fetch_engine=fetch_engine)
+        if page.height == 0:
+            return
+        yield page
+        if page.height < page_size:
+            return
+        after = (page['dt'][-1], page['logicid'][-1])
+
+def iter_wide_data_pages(sensorids, start_dt, end_dt, source='wur_db', page_size=100000, fetch_engine=None):
+    """
+    Generator of wide data pages (see pivot_data) built from iter_data_pages.
+    The rows of the last timestamp of a page are carried over to the next page,
+    so every timestamp is yielded exactly once and complete.
+    """
+    carry = None
+    for page in iter_data_pages(sensorids, start_dt, end_dt, source=source, page_size=page_size, fetch_engine=fetch_engine):
+        if carry is not None:
+            page = pl.concat([carry, page], how='vertical_relaxed')
+        last_dt = page['dt'][-1]
+        carry = page.filter(pl.col('dt') == last_dt)
+        complete = page.filter(pl.col('dt') != last_dt)
+        if complete.height > 0:
+            yield pivot_data(complete, sensorids)
+    if carry is not None and carry.height > 0:
+        yield pivot_data(carry, sensorids)
 
-    result = run_pg_query(query, config_section='postgresql_wur')
-
-    return result
-       
 def get_sensorinfo_by_site_and_varname_vu(check_table):
     
     # get sites by selecting all unique values in the 'Station' column of the check_table
@@ -341,18 +560,20 @@ def get_sensorinfo_by_site_and_varname_wur(check_table):
   
     return sensor_info
 
-def get_data(check_table, start_dt, end_dt, source='wur_db', limit=None):
-    
-    # Convert check_table to polars if it's pandas
-    if hasattr(check_table, 'to_pandas'):
-        check_table_pl = check_table
-    else:
-        check_table_pl = pl.from_pandas(check_table)
-    
+def get_sensorinfo(check_table, source='wur_db', cache_dir=None, ttl=SENSORINFO_CACHE_TTL):
+    """
+    Resolve the sensors in the check_table to sensor ids for a source.
+    When cache_dir is given the result is cached on disk per check table for ttl seconds.
+    """
     # Check if check_table is None or empty
-    if check_table_pl is None or check_table_pl.height == 0:
-        return None, None
-    
+    if check_table is None or len(check_table) == 0:
+        return None
+
+    if cache_dir is not None:
+        sensorinfo_df = load_cached_sensorinfo(cache_dir, source, check_table, ttl=ttl)
+        if sensorinfo_df is not None:
+            return sensorinfo_df
+
     # Get the sensor_info by site and varname combination
     if source == 'vu_db':
         sensorinfo_df = get_sensorinfo_by_site_and_varname_vu(check_table)
@@ -360,29 +581,44 @@ def get_data(check_table, start_dt, end_dt, source='wur_db', limit=None):
         sensorinfo_df = get_sensorinfo_by_site_and_varname_wur(check_table)
     else:
         raise ValueError(f"Unknown source: {source}. Supported sources are 'vu_db' and 'wur_db'.")
-    
-    # Check if sensorinfo_df is None or empty
-    if sensorinfo_df is None or sensorinfo_df.height == 0:
-        return None, None
-    
-    # Get the sensor_ids from sensorinfo_df
-    sensorids = sensorinfo_df['sensor_id'].to_list()
-    
+
+    if cache_dir is not None and sensorinfo_df is not None and sensorinfo_df.height > 0:
+        save_cached_sensorinfo(cache_dir, source, check_table, sensorinfo_df)
+
+    return sensorinfo_df
+
+def get_data_by_sensorids(sensorids, start_dt, end_dt, source='wur_db', limit=None, raise_on_error=False, server_dedup=False, fetch_engine=None):
+    """
+    Get the data of a list of sensor ids as a wide DataFrame with a 'datetime' column
+    and one column per sensor id (in the order of sensorids).
+    With server_dedup=True the duplicate rows are already removed by the database,
+    fetch_engine selects the transfer engine of run_pg_query.
+    """
     # Get the sensor data from the database
     if source == 'vu_db':
-        data = get_data_vudb(sensorids, start_dt, end_dt, limit=limit)
+        data = get_data_vudb(sensorids, start_dt, end_dt, limit=limit, raise_on_error=raise_on_error, server_dedup=server_dedup, fetch_engine=fetch_engine)
     elif source == 'wur_db':
-        data = get_data_wurdb(sensorids, start_dt, end_dt, limit=limit)
+        data = get_data_wurdb(sensorids, start_dt, end_dt, limit=limit, raise_on_error=raise_on_error, server_dedup=server_dedup, fetch_engine=fetch_engine)
     else:
         raise ValueError(f"Unknown source: {source}. Supported sources are 'vu_db' and 'wur_db'.")
 
     # Check if data is None or empty
     if data is None or data.height == 0:
         print(f"No data found for period {start_dt} - {end_dt}")
-        return sensorinfo_df, pl.DataFrame()
+        return pl.DataFrame()
 
+    return pivot_data(data, sensorids, dedup=not server_dedup)
+
+def pivot_data(data, sensorids, dedup=True):
+    """
+    Pivot long (dt, logicid, value) rows to a wide DataFrame with a 'datetime' column
+    and one column per sensor id (in the order of sensorids).
+    """
     # Remove duplicates based on 'dt' and 'logicid' to ensure unique entries
-    data_nodup = data.unique(subset=['dt', 'logicid'])
+    if dedup:
+        data_nodup = data.unique(subset=['dt', 'logicid'])
+    else:
+        data_nodup = data
     
     # Pivot the DataFrame using Polars
     data_df = data_nodup.pivot(index='dt', columns='logicid', values='value')
@@ -407,40 +643,201 @@ def get_data(check_table, start_dt, end_dt, source='wur_db', limit=None):
     # Rename 'dt' column to 'datetime'
     data_df = data_df.rename({'dt': 'datetime'})
     
+    return data_df
+
+def get_data(check_table, start_dt, end_dt, source='wur_db', limit=None, raise_on_error=False, cache_dir=None):
+    
+    # Get the sensor_info by site and varname combination
+    sensorinfo_df = get_sensorinfo(check_table, source=source, cache_dir=cache_dir)
+    
+    # Check if sensorinfo_df is None or empty
+    if sensorinfo_df is None or sensorinfo_df.height == 0:
+        return None, None
+    
+    # Get the sensor_ids from sensorinfo_df
+    sensorids = sensorinfo_df['sensor_id'].to_list()
+    
+    data_df = get_data_by_sensorids(sensorids, start_dt, end_dt, source=source, limit=limit, raise_on_error=raise_on_error)
+    
     return sensorinfo_df, data_df
 
-def get_data_in_chunks(check_table, start_dt, end_dt, source='wur_db', chunk_timedelta=timedelta(hours=6), limit=None):
-    """
-    Download data from the database in chunks (e.g., daily or hourly).
-    Returns concatenated sensorinfo_df and data_df.
-    Logs each chunk's download progress.
-    """
-    all_data_dfs = []
-    all_sensorinfo_dfs = []
+def get_chunks(start_dt, end_dt, chunk_timedelta=timedelta(hours=6)):
+    """Split the period between start_dt and end_dt in (chunk_start, chunk_end) tuples."""
+    chunks = []
     current_start = start_dt
-    chunk_idx = 1
-
     while current_start < end_dt:
         current_end = min(current_start + chunk_timedelta, end_dt)
-        print(f"[Chunk {chunk_idx}] Downloading: {current_start} to {current_end} ...")
-        sensorinfo_df, data_df = get_data(check_table, current_start, current_end, source=source, limit=limit)
-        print(f"[Chunk {chunk_idx}] Data rows: {data_df.height if data_df is not None else 0}, Sensorinfo rows: {sensorinfo_df.height if sensorinfo_df is not None else 0}")
-        if data_df is not None and data_df.height > 0:
-            all_data_dfs.append(data_df)
-        if sensorinfo_df is not None and sensorinfo_df.height > 0:
-            all_sensorinfo_dfs.append(sensorinfo_df)
+        chunks.append((current_start, current_end))
         current_start = current_end
-        chunk_idx += 1
+    return chunks
+
+def get_chunk_with_retries(sensorids, start_dt, end_dt, source='wur_db', limit=None, retries=CHUNK_RETRIES, retry_delay=None, chunk_idx=None, server_dedup=False, fetch_engine=None):
+    """
+    Download a single chunk, retrying it when the query fails.
+    The last error is re-raised when all attempts failed.
+    """
+    if retry_delay is None:
+        retry_delay = CHUNK_RETRY_DELAY
+    for attempt in range(retries + 1):
+        try:
+            return get_data_by_sensorids(sensorids, start_dt, end_dt, source=source, limit=limit, raise_on_error=True, server_dedup=server_dedup, fetch_engine=fetch_engine)
+        except Exception as error:
+            if attempt == retries:
+                raise
+            print(f"[Chunk {chunk_idx}] Attempt {attempt + 1} failed ({error}), retrying in {retry_delay * (attempt + 1)} s ...")
+            time.sleep(retry_delay * (attempt + 1))
+
+def get_sensor_data_in_chunks(sensorids, start_dt, end_dt, source='wur_db', chunk_timedelta=timedelta(hours=6), limit=None, max_workers=None, retries=CHUNK_RETRIES, server_dedup=False, fetch_engine=None, sink=None, coverage=None, on_chunk=None):
+    """
+    Download the data of a list of sensor ids in chunks (e.g., daily or hourly).
+    Chunks are downloaded concurrently with at most max_workers queries at a time
+    (default from MAX_CONCURRENCY for the source) and failed chunks are retried.
+    Returns the concatenated data_df, in time order.
+    When a sink (ParquetChunkSink) is given, every chunk is written to it as soon as it
+    arrives instead of being kept in memory, chunks already in the sink are skipped,
+    and a LazyFrame over the sink is returned.
+    When a CoverageIndex is given, every downloaded chunk is recorded in it and the
+    caller is responsible for only requesting uncovered periods.
+    When on_chunk is given it is called with the data of every chunk in time order, as soon
+    as all earlier chunks have arrived, e.g. to compute statistics while downloading.
+    Logs each chunk's download progress.
+    """
+    if max_workers is None:
+        max_workers = MAX_CONCURRENCY.get(source, 1)
+
+    chunks = get_chunks(start_dt, end_dt, chunk_timedelta)
+    results = [None] * len(chunks)
+    failed_chunks = []
+
+    # Chunks finish in any order, on_chunk gets them in time order
+    arrived = {}
+    next_chunk = [1]
+    def deliver_chunk(chunk_idx, data_df):
+        if on_chunk is None:
+            return
+        arrived[chunk_idx] = data_df
+        while next_chunk[0] in arrived:
+            data_df = arrived.pop(next_chunk[0])
+            if data_df is not None and data_df.height > 0:
+                on_chunk(data_df)
+            next_chunk[0] += 1
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {}
+        for chunk_idx, (current_start, current_end) in enumerate(chunks, start=1):
+            if sink is not None and coverage is None and sink.has_chunk(current_start, current_end, sensorids):
+                print(f"[Chunk {chunk_idx}] Already downloaded: {current_start} to {current_end}")
+                if on_chunk is not None:
+                    deliver_chunk(chunk_idx, pl.read_parquet(sink.chunk_path(current_start, current_end)))
+                continue
+            print(f"[Chunk {chunk_idx}] Downloading: {current_start} to {current_end} ...")
+            future = executor.submit(
+                get_chunk_with_retries, sensorids, current_start, current_end,
+                source=source, limit=limit, retries=retries, chunk_idx=chunk_idx,
+                server_dedup=server_dedup, fetch_engine=fetch_engine
+            )
+            futures[future] = chunk_idx
+
+        for future in as_completed(futures):
+            chunk_idx = futures[future]
+            try:
+                data_df = future.result()
+            except Exception as error:
+                # Keep the other chunks, the failed ones are reported at the end
+                print(f"[Chunk {chunk_idx}] Failed after {retries + 1} attempts: {error}")
+                failed_chunks.append(chunks[chunk_idx - 1])
+                deliver_chunk(chunk_idx, None)
+                continue
+            print(f"[Chunk {chunk_idx}] Data rows: {data_df.height if data_df is not None else 0}")
+            deliver_chunk(chunk_idx, data_df)
+            if sink is not None:
+                if data_df is not None and data_df.height > 0:
+                    sink.write_chunk(*chunks[chunk_idx - 1], data_df)
+                if coverage is not None:
+                    coverage.add(sensorids, *chunks[chunk_idx - 1])
+            else:
+                results[chunk_idx - 1] = data_df
+
+    if sink is not None:
+        if failed_chunks:
+            print(f"Warning: {len(failed_chunks)} chunks failed for {source}: {failed_chunks}")
+        print(f"Finished downloading {len(chunks)} chunks to {sink.directory}")
+        return sink.scan(start_dt, end_dt)
+
+    # Reassemble the chunks in time order
+    all_data_dfs = [data_df for data_df in results if data_df is not None and data_df.height > 0]
 
     # Concatenate all chunks
     if all_data_dfs:
-        data_df = pl.concat(all_data_dfs)
+        data_df = pl.concat(all_data_dfs, how='diagonal_relaxed')
+        # Chunk boundaries are included in both neighbouring chunks (BETWEEN), keep one row per timestamp
+        data_df = data_df.unique(subset=['datetime'], keep='first', maintain_order=True)
     else:
         data_df = pl.DataFrame()
-    if all_sensorinfo_dfs:
-        sensorinfo_df = pl.concat(all_sensorinfo_dfs).unique()
-    else:
-        sensorinfo_df = pl.DataFrame()
 
-    print(f"Finished downloading {chunk_idx-1} chunks. Total data rows: {data_df.height}, Total sensorinfo rows: {sensorinfo_df.height}")
+    if failed_chunks:
+        print(f"Warning: {len(failed_chunks)} chunks failed for {source}: {failed_chunks}")
+    print(f"Finished downloading {len(chunks)} chunks. Total data rows: {data_df.height}")
+    return data_df
+
+def get_data_in_chunks(check_table, start_dt, end_dt, source='wur_db', chunk_timedelta=timedelta(hours=6), limit=None, max_workers=None, retries=CHUNK_RETRIES, cache_dir=None, server_dedup=False, fetch_engine=None, sink=None, on_chunk=None):
+    """
+    Download data from the database in chunks (e.g., daily or hourly).
+    The sensors in the check_table are resolved once (cached in cache_dir if given),
+    after which only the sensor ids are used for the chunked data queries.
+    Returns sensorinfo_df and the concatenated data_df, or a LazyFrame over the
+    written chunks when a sink is given (see get_sensor_data_in_chunks).
+    """
+    # Resolve the sensors once for the whole period
+    sensorinfo_df = get_sensorinfo(check_table, source=source, cache_dir=cache_dir)
+    if sensorinfo_df is None or sensorinfo_df.height == 0:
+        print(f"No sensor information found for {source}.")
+        return pl.DataFrame(), pl.DataFrame()
+    print(f"Resolved {sensorinfo_df.height} sensors for {source}")
+
+    sensorids = sensorinfo_df['sensor_id'].to_list()
+    data_df = get_sensor_data_in_chunks(
+        sensorids, start_dt, end_dt, source=source, chunk_timedelta=chunk_timedelta,
+        limit=limit, max_workers=max_workers, retries=retries,
+        server_dedup=server_dedup, fetch_engine=fetch_engine, sink=sink, on_chunk=on_chunk
+    )
     return sensorinfo_df, data_df
+
+def get_data_in_store(check_table, start_dt, end_dt, store, source='wur_db', chunk_timedelta=timedelta(hours=6), max_workers=None, retries=CHUNK_RETRIES, cache_dir=None, server_dedup=False, fetch_engine=None, on_chunk=None):
+    """
+    Bring the PartitionStore up to date for the sensors in the check_table and return
+    sensorinfo_df and a LazyFrame over the requested window.
+    Only the periods each sensor is missing in the coverage index are downloaded,
+    sensors that miss the same period are fetched together.
+    on_chunk is called with every downloaded chunk, in time order per group of sensors
+    (see get_sensor_data_in_chunks).
+    """
+    sensorinfo_df = get_sensorinfo(check_table, source=source, cache_dir=cache_dir)
+    if sensorinfo_df is None or sensorinfo_df.height == 0:
+        print(f"No sensor information found for {source}.")
+        return pl.DataFrame(), None
+    sensorids = sensorinfo_df['sensor_id'].to_list()
+
+    # Compute the uncovered periods per sensor and coalesce them into queries
+    coverage = store.coverage(source)
+    missing = coverage.missing(sensorids, start_dt, end_dt)
+    groups = coverage.group_missing(missing)
+    print(f"{source}: {len(missing)} of {len(sensorids)} sensors need data, {len(groups)} queries")
+
+    for (gap_start, gap_end), group_sensorids in groups:
+        print(f"{source}: downloading {len(group_sensorids)} sensors from {gap_start} to {gap_end}")
+        get_sensor_data_in_chunks(
+            group_sensorids, gap_start.tz_convert(start_dt.tzinfo), gap_end.tz_convert(start_dt.tzinfo),
+            source=source, chunk_timedelta=chunk_timedelta, max_workers=max_workers, retries=retries,
+            server_dedup=server_dedup, fetch_engine=fetch_engine,
+            sink=store.sink(source, group_sensorids), coverage=coverage, on_chunk=on_chunk
+        )
+
+    data_lf = store.scan(source, start_dt, end_dt)
+    if data_lf is None:
+        return sensorinfo_df, None
+
+    # Only the sensors of the current check table, the store may hold more
+    columns = data_lf.collect_schema().names()
+    sensor_cols = [str(sid) for sid in sensorids if str(sid) in columns]
+    return sensorinfo_df, data_lf.select(['datetime'] + sensor_cols)
@@ -0,0 +1,145 @@
+import numpy as np
+
+# Page width in pixels when the real width is not known
+DEFAULT_GRAPH_WIDTH = 1200
+# Pixels of the page width that are not plot area: the page padding, the axis margins (80 px
+# on either side) and the legend right of the timeline
+PLOT_MARGIN = 250
+# The point budget is never based on a plot area narrower than this
+MIN_PLOT_WIDTH = 200
+# Points per pixel of plot area, min/max downsampling draws the lowest and highest value of every two pixels.
+# One point per pixel is what the screen can show: a week of 1-minute data (10080 samples) on a
+# 1200 px page is reduced about 10x, longer windows or finer data proportionally more.
+POINTS_PER_PIXEL = 1
+# Consecutive points further apart than this many sampling steps (or buckets) are drawn as a gap
+GAP_FACTOR = 3
+
+def point_budget(width=None):
+    """Number of points per trace worth sending to the browser for a page of width pixels."""
+    if not width or width <= 0:
+        width = DEFAULT_GRAPH_WIDTH
+    return max(int(width) - PLOT_MARGIN, MIN_PLOT_WIDTH) * POINTS_PER_PIXEL
+
+def to_int64(x):
+    """
+    Datetimes, timedeltas (in microseconds) or integers as int64, so buckets and gaps can be
+    computed with integer arithmetic. Floats are refused, casting would truncate them.
+    """
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[us]').astype(np.int64)
+    if np.issubdtype(x.dtype, np.timedelta64):
+        return x.astype('timedelta64[us]').astype(np.int64)
+    if not np.issubdtype(x.dtype, np.integer):
+        raise TypeError(f"Expected datetimes, timedeltas or integers, got {x.dtype}")
+    return x.astype(np.int64)
+
+def minmax_indices(x, y, n_out):
+    """
+    Indices of the lowest and highest value in each of n_out // 2 equal time buckets,
+    in time order, plus the first and last point. x is int64 and sorted, y has no NaNs.
+    Spikes always survive, and buckets without data stay empty so gaps remain visible.
+    """
+    n_buckets = max(1, n_out // 2)
+    span = int(x[-1] - x[0]) + 1
+    bucket = ((x - x[0]) * n_buckets // span).astype(np.int64)
+
+    # x is sorted, so every bucket is a contiguous run of rows
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    counts = np.diff(np.r_[starts, len(x)])
+    bucket_of_row = np.repeat(np.arange(len(starts)), counts)
+
+    # First row of each bucket that holds its min, resp. its max
+    indices = [[0, len(x) - 1]]
+    for extreme in (np.minimum, np.maximum):
+        rows = np.flatnonzero(y == np.repeat(extreme.reduceat(y, starts), counts))
+        first = np.r_[True, bucket_of_row[rows][1:] != bucket_of_row[rows][:-1]]
+        indices.append(rows[first])
+    return np.unique(np.concatenate(indices))
+
+def lttb_indices(x, y, n_out):
+    """
+    Indices selected by Largest-Triangle-Three-Buckets: the first and last point, plus per
+    bucket the point spanning the largest triangle with the previously selected point and
+    the mean of the next bucket. Keeps the visual shape with about one point per pixel.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    xf = (x - x[0]).astype(np.float64)
+    yf = np.asarray(y, dtype=np.float64)
+
+    # Bucket boundaries of the points between the first and the last
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    csum_x = np.r_[0.0, np.cumsum(xf)]
+    csum_y = np.r_[0.0, np.cumsum(yf)]
+    next_starts, next_ends = edges[1:], np.r_[edges[2:], n]
+    mean_x = (csum_x[next_ends] - csum_x[next_starts]) / (next_ends - next_starts)
+    mean_y = (csum_y[next_ends] - csum_y[next_starts]) / (next_ends - next_starts)
+    # The last bucket looks ahead to the last point
+    mean_x[-1], mean_y[-1] = xf[-1], yf[-1]
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        area = np.abs(
+            (xf[previous] - mean_x[i]) * (yf[start:end] - yf[previous])
+            - (xf[previous] - xf[start:end]) * (mean_y[i] - yf[previous])
+        )
+        previous = start + int(np.argmax(area))
+        selected[i + 1] = previous
+    return selected
+
+def insert_gaps(x, y, max_step):
+    """Insert a NaN between consecutive points more than max_step apart, so Plotly breaks the line."""
+    gap_after = np.flatnonzero(np.diff(x) > max_step)
+    if len(gap_after) == 0:
+        return x, y
+    return np.insert(x, gap_after + 1, x[gap_after] + 1), np.insert(y, gap_after + 1, np.nan)
+
+def downsample(x, y, n_out=None, method='minmax', sampling_step=None):
+    """
+    Reduce a series to about n_out points (see point_budget) for plotting, x are datetimes,
+    timedeltas or integers (see to_int64). method is 'minmax' (lowest and highest value per time bucket, keeps all extremes)
+    or 'lttb' (Largest-Triangle-Three-Buckets, keeps the shape). Missing values are
+    dropped and gaps in the data are drawn as line breaks.
+    sampling_step is the regular distance between samples (a timedelta for datetimes),
+    by default the median distance between the points.
+    Returns the x and y NumPy arrays to plot, x with the dtype of the input.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=np.float64)
+    if n_out is None:
+        n_out = point_budget()
+    valid = ~np.isnan(y)
+    x, y = x[valid], y[valid]
+    if len(x) == 0:
+        return x, y
+
+    xi = to_int64(x)
+    if sampling_step is not None:
+        if np.issubdtype(x.dtype, np.datetime64):
+            sampling_step = np.timedelta64(sampling_step)
+        max_step = GAP_FACTOR * to_int64(sampling_step)
+    else:
+        steps = np.diff(xi)
+        max_step = GAP_FACTOR * (np.median(steps) if len(steps) > 0 else 0)
+    if len(xi) > n_out:
+        if method == 'lttb':
+            keep = lttb_indices(xi, y, n_out)
+            bucket_width = (xi[-1] - xi[0]) / max(1, n_out - 2)
+        elif method == 'minmax':
+            keep = minmax_indices(xi, y, n_out)
+            bucket_width = (xi[-1] - xi[0]) / max(1, n_out // 2)
+        else:
+            raise ValueError(f"Unknown downsampling method: {method}")
+        xi, y = xi[keep], y[keep]
+        # Points of neighbouring buckets can be up to two bucket widths apart
+        max_step = max(max_step, GAP_FACTOR * bucket_width)
+
+    xi, y = insert_gaps(xi, y, max_step)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return xi.astype('datetime64[us]'), y
+    return xi.astype(x.dtype), y
@@ -64,6 +64,26 @@ def adapt_start_dt_to_existing_dataset(start_dt, end_dt, file, tz):
     
     return start_dt
 
+def match_existing_header(file, header_names, header_units):
+    """
+    Positions of the header columns (name and unit) in the header of an existing file,
+    so new data can be appended in the column order of the file.
+    Returns None if the file has other columns, and the positions in order if the file
+    does not exist yet.
+    """
+    columns = list(zip(header_names, header_units))
+    if not os.path.exists(file):
+        return list(range(len(columns)))
+    with open(file, 'r') as f:
+        file_columns = list(zip(f.readline().strip().split(','), f.readline().strip().split(',')))
+    if file_columns == columns:
+        return list(range(len(columns)))
+    # Same columns in another order, only if every column can be told apart
+    if sorted(file_columns) != sorted(columns) or len(set(columns)) != len(columns):
+        return None
+    position = {column: i for i, column in enumerate(columns)}
+    return [position[column] for column in file_columns]
+
 def get_check_table(filename='check_table.csv'):
     """ 
     This function reads the check_table.csv file and returns a DataFrame with the columns and index names
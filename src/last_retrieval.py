@@ -1,72 +1,49 @@
 import os
 import pandas as pd
 import polars as pl
-from datetime import datetime
+from src.cache_key import read_manifest, write_manifest
+from src.coverage import to_utc
+from src.sensorinfo_cache import SENSORINFO_CACHE_TTL
 
-def check_dates_last_retrieval(lastrun_info_file, start_dt, end_dt):
-    # Read start and end dates from the text file
-    if os.path.exists(lastrun_info_file):
-        with open(lastrun_info_file, 'r') as f:
-            lines = f.readlines()
-            start_dt_retrieved = lines[0].strip().split(': ')[1]
-            end_dt_retrieved = lines[1].strip().split(': ')[1]
-            
-            # Convert the retrieved dates to datetime objects for comparison (format: 2025-06-13 00:00:00+00:00)
-            start_dt_retrieved = pd.to_datetime(start_dt_retrieved)
-            end_dt_retrieved = pd.to_datetime(end_dt_retrieved)
-            # compare the retrieved start and end dates with the original start and end dates
-
-        if start_dt == start_dt_retrieved and end_dt == end_dt_retrieved:
-            print("Start and end dates retrieved successfully and match the original dates.")
-            dates_match = True
-        else:
-            print("Start and/or end dates retrieved do not match the original dates. There might be an issue with the retrieval process.")
-            dates_match = False
-    else:
-        dates_match = False
-    return dates_match
-
-def check_checktable_last_retrieval(check_table_file, check_table):
-    if os.path.exists(check_table_file):
-        print(f"Check table file found: {check_table_file}")
-        # Read check_table from the text file and compare it with the original check_table
-        try:
-            check_table_retrieved = pd.read_csv(check_table_file, sep=r'\s+')
-        except:
-            # Try with different separators if whitespace doesn't work
-            try:
-                check_table_retrieved = pd.read_csv(check_table_file, sep='\t')
-            except:
-                check_table_retrieved = pd.read_csv(check_table_file)
-        
-        # Compare the retrieved check_table with the original check_table
-        if check_table.equals(check_table_retrieved):
-            print("Check table retrieved successfully and matches the original check table.")
-            check_table_match = True
-        else:
-            print("Check table retrieved does not match the original check table. There might be an issue with the retrieval process.")
-            check_table_match = False
-    else:
-        print(f"Check table file not found: {check_table_file}. Proceeding to fetch data from the database.")
-        check_table_match = False
-    return check_table_match
+# Check if the data files exist and were written for the same cache key
+def check_if_download_data_needed(manifest_file, cache_key, data_df_file, sensorinfo_df_file):
+    """
+    Lookup in the manifest next to the data files, no data is read.
+    Returns False if the data files were written for cache_key and the window had settled.
+    """
+    manifest = read_manifest(manifest_file)
+    if manifest.get('cache_key') != cache_key:
+        print("Check table, sensors or dates changed since the last retrieval. Proceeding to fetch data from the database.")
+        return True  # Need to download data
+    if not manifest.get('complete', False):
+        print("Last retrieval contains data that may still change. Proceeding to fetch data from the database.")
+        return True  # Need to download data
+    if os.path.exists(data_df_file) and os.path.exists(sensorinfo_df_file):
+        print(f"Data files found: {data_df_file} and {sensorinfo_df_file}")
+        return False  # No need to download data
+    print(f"Data files not found: {data_df_file} and {sensorinfo_df_file}. Proceeding to fetch data from the database.")
+    return True  # Need to download data
 
-# Check if the data files exist and if the dates and check_table match
-def check_if_download_data_needed(last_retrieval_info_file, start_dt, end_dt, last_retrieval_checktable_file, check_table, data_df_file, sensorinfo_df_file):
-    dates_match = check_dates_last_retrieval(last_retrieval_info_file, start_dt, end_dt)
-    check_table_match = check_checktable_last_retrieval(last_retrieval_checktable_file, check_table)
+def check_if_sensors_stale(manifest_file, ttl=SENSORINFO_CACHE_TTL):
+    """True if the sensors in the manifest were resolved more than ttl seconds ago."""
+    resolved_at = read_manifest(manifest_file).get('sensors_resolved_at')
+    if resolved_at is None:
+        return True
+    return pd.Timestamp.now(tz='UTC') - pd.Timestamp(resolved_at) > pd.Timedelta(seconds=ttl)
 
-    if dates_match and check_table_match:
-        if os.path.exists(data_df_file) and os.path.exists(sensorinfo_df_file):
-            print(f"Data files found: {data_df_file} and {sensorinfo_df_file}")
-            return False  # No need to download data
-        else:
-            print(f"Data files not found: {data_df_file} and {sensorinfo_df_file}. Proceeding to fetch data from the database.")
-            return True  # Need to download data
-    else:
-        print("Dates or check table do not match. Proceeding to fetch data from the database.")
+def check_if_sensors_changed(manifest_file, sensor_keys):
+    """
+    Compare freshly resolved sensor keys with the ones in the manifest.
+    If they are unchanged the resolve time in the manifest is renewed.
+    """
+    manifest = read_manifest(manifest_file)
+    if manifest.get('sensors') != sensor_keys:
+        print("Sensors changed since the last retrieval. Proceeding to fetch data from the database.")
         return True  # Need to download data
-    
+    manifest['sensors_resolved_at'] = pd.Timestamp.now(tz='UTC').isoformat()
+    write_manifest(manifest_file, **manifest)
+    return False
+
 # Add extra info to sensorinfo_df
 def add_extra_info_to_sensorinfo(sensorinfo_df, variable_info_file):
     """
@@ -88,34 +65,19 @@ def add_extra_info_to_sensorinfo(sensorinfo_df, variable_info_file):
 
     return sensorinfo_df
   
-def save_last_retrieval_info(check_table, start_dt, end_dt, last_retrieval_info_file, last_retrieval_checktable_file):
+def save_last_retrieval_info(manifest_file, cache_key, sensor_keys, start_dt, end_dt, settle_time):
     """
-    Save the start and end dates to a text file.
+    Save the cache key and the resolved sensors of the data files in the manifest.
+    The retrieval is complete when the whole window had settled at the time of writing.
     """
-    
-    # Get the directory of the last retrieval info file
-    temp_path = os.path.dirname(last_retrieval_info_file)
-    
-    # Create the directory if it doesn't exist
-    if not os.path.exists(temp_path):
-        os.makedirs(temp_path)
-
-    # Get the directory of the last retrieval check table file
-    last_retrieval_checktable_path = os.path.dirname(last_retrieval_checktable_file)
-    
-    # Create the directory if it doesn't exist
-    if not os.path.exists(last_retrieval_checktable_path):
-        os.makedirs(last_retrieval_checktable_path)    
-
-    with open(last_retrieval_info_file, 'w') as f:
-        f.write(f"Start date: {start_dt}\n")
-        f.write(f"End date: {end_dt}\n")
-        
-    # Save the check_table to a text file
-    # Handle both Pandas and Polars DataFrames
-    with open(last_retrieval_checktable_file, 'w') as f:
-        if hasattr(check_table, 'height'):  # It's Polars
-            # Convert to string representation
-            f.write(str(check_table))
-        else:  # It's Pandas
-            f.write(check_table.to_string(index=False))
+    created_at = pd.Timestamp.now(tz='UTC')
+    write_manifest(
+        manifest_file,
+        cache_key,
+        sensors=sensor_keys,
+        sensors_resolved_at=created_at.isoformat(),
+        start_dt=pd.Timestamp(start_dt).isoformat(),
+        end_dt=pd.Timestamp(end_dt).isoformat(),
+        created_at=created_at.isoformat(),
+        complete=bool(to_utc(end_dt) <= created_at - settle_time)
+    )
@@ -13,6 +13,8 @@ def create_app_layout(dm, data_df, aggrid_datatable, pivot_table):
         # Store to track Django theme changes (updated only when theme switcher is clicked)
         dcc.Store(id='django-theme-store', data='light'),
         dcc.Store(id='selected-cells-store', data=[]),  # Store for tracking selected cells
+        dcc.Store(id='graph-width-store', data=None),  # Width of the page in pixels, sets the points per trace
+        dcc.Store(id='timeline-traces-store', data={}),  # Cells, sensor ids and visible range of the timeline traces
         dcc.Store(id='pivot-table-store', data=pivot_table.to_dict('records')),  # Store pivot table data
         dbc.Container(
             [
@@ -0,0 +1,72 @@
+import polars as pl
+
+class LazyData:
+    """
+    Thin query facade over a LazyFrame of the wide data (datetime + one column per sensor).
+    Mimics the parts of the DataFrame API the app uses, but only the requested columns
+    and time range are read, so predicates and projections are pushed down to the Parquet scan.
+    """
+
+    def __init__(self, data_lf):
+        self.data_lf = data_lf
+        self._columns = None
+        self._height = None
+
+    @classmethod
+    def scan(cls, path):
+        """Facade over a Parquet file, nothing is read until a query is collected."""
+        return cls(pl.scan_parquet(path))
+
+    @property
+    def columns(self):
+        """Column names, from the Parquet schema."""
+        if self._columns is None:
+            self._columns = self.data_lf.collect_schema().names()
+        return self._columns
+
+    @property
+    def height(self):
+        """Number of rows, from the Parquet metadata."""
+        if self._height is None:
+            self._height = self.data_lf.select(pl.len()).collect().item()
+        return self._height
+
+    def __len__(self):
+        return self.height
+
+    def __getitem__(self, column):
+        return self.data_lf.select(column).collect().to_series()
+
+    def query(self, columns=None, start_dt=None, end_dt=None):
+        """
+        LazyFrame restricted to the period between start_dt and end_dt and to the given
+        columns (datetime is always included).
+        """
+        data_lf = self.data_lf
+        if start_dt is not None:
+            data_lf = data_lf.filter(pl.col('datetime') >= start_dt)
+        if end_dt is not None:
+            data_lf = data_lf.filter(pl.col('datetime') <= end_dt)
+        if columns is not None:
+            columns = [col for col in columns if col != 'datetime']
+            data_lf = data_lf.select(['datetime'] + columns)
+        return data_lf
+
+    def select(self, *exprs, start_dt=None, end_dt=None):
+        """Like DataFrame.select, optionally limited to a time range."""
+        return self.query(start_dt=start_dt, end_dt=end_dt).select(*exprs).collect()
+
+    def filter(self, *predicates):
+        """Like DataFrame.filter, returns a new facade."""
+        return LazyData(self.data_lf.filter(*predicates))
+
+    def with_columns(self, *exprs):
+        """Like DataFrame.with_columns, returns a new facade."""
+        return LazyData(self.data_lf.with_columns(*exprs))
+
+    def lazy(self):
+        return self.data_lf
+
+    def collect(self):
+        """Read everything into a DataFrame."""
+        return self.data_lf.collect()
@@ -0,0 +1,301 @@
+import threading
+import warnings
+import numpy as np
+import pandas as pd
+import polars as pl
+
+ZSCORE_THRESHOLD = 4
+MODZ_THRESHOLD = 3.5
+IQR_FACTOR = 1.5
+PERCENTILES = (0.01, 0.99)
+ROLLING_WINDOW = '2h'  # centred time window
+
+# Outlier methods, label shown in the app
+OUTLIER_METHODS = {
+    'zscore': 'Z-score',
+    'iqr': 'IQR',
+    'modz': 'Modified Z-score',
+    'percentile': 'Percentile (1-99%)',
+    'rolling': f'Rolling Z-score ({ROLLING_WINDOW})',
+}
+
+class PackedMask:
+    """
+    Outlier mask of a group of sensors, stored bit-packed: one bit per (sensor, row),
+    1/8 of the memory of a boolean frame.
+    """
+
+    def __init__(self, sensor_ids, mask):
+        self.sensor_ids = list(sensor_ids)
+        self.n_rows = mask.shape[0]
+        self._column = {sid: i for i, sid in enumerate(self.sensor_ids)}
+        # One packed row of bits per sensor
+        self.bits = np.packbits(np.asarray(mask, dtype=bool).T, axis=1)
+
+    def __contains__(self, sensor_id):
+        return str(sensor_id) in self._column
+
+    def get(self, sensor_id):
+        """Boolean array with one value per row of the data."""
+        return np.unpackbits(self.bits[self._column[str(sensor_id)]], count=self.n_rows).astype(bool)
+
+    def indices(self, sensor_id):
+        """Row numbers of the outliers of a sensor."""
+        return np.flatnonzero(self.get(sensor_id))
+
+    def count(self):
+        """Dictionary of sensor_id to the number of outliers."""
+        counts = np.unpackbits(self.bits, axis=1, count=self.n_rows).sum(axis=1)
+        return dict(zip(self.sensor_ids, counts.tolist()))
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+def zscore_mask(values, datetimes=None):
+    """Values more than ZSCORE_THRESHOLD standard deviations from the mean of all sensors at that time."""
+    mean = np.nanmean(values, axis=1, keepdims=True)
+    std = np.nanstd(values, axis=1, ddof=1, keepdims=True)
+    zscores = np.nan_to_num((values - mean) / std, nan=0.0, posinf=np.inf, neginf=-np.inf)
+    return np.abs(zscores) > ZSCORE_THRESHOLD
+
+def iqr_mask(values, datetimes=None):
+    """Values outside the IQR_FACTOR * IQR fences of each sensor."""
+    q1, q3 = np.nanquantile(values, [0.25, 0.75], axis=0)
+    iqr = q3 - q1
+    return (values < q1 - IQR_FACTOR * iqr) | (values > q3 + IQR_FACTOR * iqr)
+
+def modz_mask(values, datetimes=None):
+    """Modified z-score (median and MAD of all sensors at that time) above MODZ_THRESHOLD."""
+    median = np.nanmedian(values, axis=1, keepdims=True)
+    mad = np.nanmedian(np.abs(values - median), axis=1, keepdims=True)
+    modz = np.nan_to_num(0.6745 * (values - median) / mad, nan=0.0, posinf=np.inf, neginf=-np.inf)
+    return np.abs(modz) > MODZ_THRESHOLD
+
+def percentile_mask(values, datetimes=None):
+    """Values below the 1st or above the 99th percentile of each sensor."""
+    lower, upper = np.nanquantile(values, PERCENTILES, axis=0)
+    return (values < lower) | (values > upper)
+
+def rolling_mask(values, datetimes, window=ROLLING_WINDOW):
+    """
+    Values more than ZSCORE_THRESHOLD standard deviations from the mean of the centred
+    time window (e.g. '2h') of the same sensor, see RollingZScore.
+    """
+    rolling = RollingZScore(values.shape[1], window=window)
+    masks = [rolling.update(datetimes, values), rolling.finish()]
+    return np.vstack([mask for _, mask in masks])
+
+class RollingZScore:
+    """
+    Streaming rolling z-score over a centred time window, for many sensors at once.
+    Rows are fed in time order in chunks of any size (update), and the outlier flags of a
+    row are returned as soon as the data up to half a window after it has been seen.
+    Only the rows of the last window are kept, so memory does not grow with the period.
+
+    The window sums are cumulative sums over that buffer, of the values minus a fixed
+    per-sensor reference (the first value seen) so the variance does not lose precision
+    to large offsets like air pressure in Pa. Missing values are skipped.
+    """
+
+    def __init__(self, n_sensors, window=ROLLING_WINDOW, threshold=ZSCORE_THRESHOLD):
+        self.n_sensors = n_sensors
+        self.half_window = np.timedelta64(pd.Timedelta(window).value // 2, 'ns')
+        self.threshold = threshold
+        self.reference = np.full(n_sensors, np.nan)
+        self.datetimes = np.empty(0, dtype='datetime64[ns]')
+        self.values = np.empty((0, n_sensors))
+        self.n_done = 0  # rows at the start of the buffer that were returned already
+
+    def update(self, datetimes, values):
+        """
+        Add rows (datetimes ascending, values rows x sensors with NaN for missing).
+        Rows at or before the last row seen are skipped (chunks that overlap at the boundary).
+        Returns (datetimes, mask) of the rows whose window is complete.
+        """
+        datetimes = np.asarray(datetimes).astype('datetime64[ns]')
+        values = np.asarray(values, dtype=float).reshape(len(datetimes), self.n_sensors)
+        if len(self.datetimes) > 0:
+            new = datetimes > self.datetimes[-1]
+            datetimes, values = datetimes[new], values[new]
+
+        # Reference per sensor: the first value seen
+        unset = np.flatnonzero(np.isnan(self.reference))
+        if len(unset) > 0 and len(values) > 0:
+            valid = ~np.isnan(values[:, unset])
+            first = values[valid.argmax(axis=0), unset]
+            self.reference[unset] = np.where(valid.any(axis=0), first, np.nan)
+
+        self.datetimes = np.concatenate([self.datetimes, datetimes])
+        self.values = np.vstack([self.values, values])
+        if len(self.datetimes) == 0:
+            return self._empty()
+        # Rows with the whole window after them seen
+        n_ready = np.searchsorted(self.datetimes, self.datetimes[-1] - self.half_window, side='right')
+        return self._flush(n_ready)
+
+    def finish(self):
+        """Flags of the remaining rows, at the end of the data."""
+        return self._flush(len(self.datetimes))
+
+    def _flush(self, n_ready):
+        if n_ready <= self.n_done:
+            return self._empty()
+        shifted = self.values - np.nan_to_num(self.reference)
+        valid = ~np.isnan(shifted)
+        filled = np.where(valid, shifted, 0.0)
+
+        # Cumulative sums with a leading zero row, a window sum is the difference of two rows
+        def cumulative(x):
+            return np.vstack([np.zeros((1, x.shape[1])), np.cumsum(x, axis=0)])
+        csum, csum_sq, ccount = cumulative(filled), cumulative(filled ** 2), cumulative(valid.astype(float))
+
+        # Window [t - half_window, t + half_window) of every row that is ready
+        rows = np.arange(self.n_done, n_ready)
+        times = self.datetimes[rows]
+        lo = np.searchsorted(self.datetimes, times - self.half_window, side='left')
+        hi = np.searchsorted(self.datetimes, times + self.half_window, side='left')
+        n = ccount[hi] - ccount[lo]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = (csum[hi] - csum[lo]) / n
+            std = np.sqrt(np.clip((csum_sq[hi] - csum_sq[lo] - n * mean ** 2) / (n - 1), 0, None))
+            zscores = np.nan_to_num((shifted[rows] - mean) / std, nan=0.0, posinf=np.inf, neginf=-np.inf)
+        mask = np.abs(zscores) > self.threshold
+
+        # Drop the rows that are no longer inside the window of any row still to come
+        next_time = self.datetimes[n_ready] if n_ready < len(self.datetimes) else self.datetimes[-1]
+        keep_from = np.searchsorted(self.datetimes, next_time - self.half_window, side='left')
+        self.datetimes = self.datetimes[keep_from:]
+        self.values = self.values[keep_from:]
+        self.n_done = n_ready - keep_from
+        return times, mask
+
+    def _empty(self):
+        return np.empty(0, dtype='datetime64[ns]'), np.empty((0, self.n_sensors), dtype=bool)
+
+class StreamingOutliers:
+    """
+    Rolling z-score outlier flags of data that arrives in chunks, e.g. as the on_chunk
+    callback of get_data_in_store. Every download, a set of sensor columns in time order,
+    gets its own RollingZScore. Chunks of the two sources arrive from different threads.
+    Only the outlier timestamps are kept per sensor.
+    """
+
+    def __init__(self, window=ROLLING_WINDOW, threshold=ZSCORE_THRESHOLD):
+        self.window = window
+        self.threshold = threshold
+        self._streams = {}  # sensor columns of a download to its RollingZScore
+        self._outliers = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, data_df):
+        self.update(data_df)
+
+    def update(self, data_df):
+        """Process a chunk (wide Polars frame with datetime and sensor columns)."""
+        if data_df is None or data_df.height == 0:
+            return
+        data_df = data_df.sort('datetime')
+        sensor_ids = tuple(col for col in data_df.columns if col != 'datetime')
+        values = data_df.select(pl.col(list(sensor_ids)).cast(pl.Float64).fill_null(np.nan)).to_numpy()
+        datetimes = data_df['datetime'].dt.replace_time_zone(None).to_numpy()
+        with self._lock:
+            rolling = self._streams.get(sensor_ids)
+            # The same sensors downloaded for an earlier period start a new pass
+            if rolling is not None and len(rolling.datetimes) > 0 and datetimes[0] < rolling.datetimes[-1]:
+                self._add(sensor_ids, *rolling.finish())
+                rolling = None
+            if rolling is None:
+                rolling = RollingZScore(len(sensor_ids), window=self.window, threshold=self.threshold)
+                self._streams[sensor_ids] = rolling
+            self._add(sensor_ids, *rolling.update(datetimes, values))
+
+    def finish(self):
+        """Flag the rows at the end of the data, call after the last chunk."""
+        with self._lock:
+            for sensor_ids, rolling in self._streams.items():
+                self._add(sensor_ids, *rolling.finish())
+            self._streams = {}
+
+    def _add(self, sensor_ids, datetimes, mask):
+        for i in np.flatnonzero(mask.any(axis=0)):
+            self._outliers.setdefault(sensor_ids[i], []).append(datetimes[mask[:, i]])
+
+    def outlier_times(self, sensor_id):
+        """Timestamps (naive UTC) of the outliers of a sensor."""
+        parts = self._outliers.get(str(sensor_id), [])
+        return np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype='datetime64[ns]')
+
+    def count(self):
+        """Dictionary of sensor_id to the number of outliers."""
+        return {sensor_id: sum(len(part) for part in parts) for sensor_id, parts in self._outliers.items()}
+
+MASK_FUNCTIONS = {
+    'zscore': zscore_mask,
+    'iqr': iqr_mask,
+    'modz': modz_mask,
+    'percentile': percentile_mask,
+    'rolling': rolling_mask,
+}
+
+class OutlierEngine:
+    """
+    Outlier detection for every variable in sensorinfo_df. Masks are computed on the first
+    request of a (variable, method) and cached as PackedMask. Only the sensor columns of
+    that variable are read from data_df (DataFrame or LazyData).
+    """
+
+    def __init__(self, data_df, sensorinfo_df):
+        self.data_df = data_df
+        self.sensorinfo_df = sensorinfo_df
+        self._masks = {}
+        self._datetimes = None
+
+        # Variable name to the sensor columns in data_df
+        data_columns = set(data_df.columns)
+        self.sensor_groups = {}
+        for variable, sensor_id in sensorinfo_df.select(['variable_name', pl.col('sensor_id').cast(pl.Utf8)]).iter_rows():
+            if sensor_id in data_columns:
+                self.sensor_groups.setdefault(variable, []).append(sensor_id)
+
+    @property
+    def datetimes(self):
+        """Datetime of every row, as a NumPy array."""
+        if self._datetimes is None:
+            self._datetimes = self.data_df.select('datetime').to_series().to_numpy()
+        return self._datetimes
+
+    def values(self, variable):
+        """Values of the sensors of a variable as a float matrix (rows x sensors), NaN for missing."""
+        sensor_ids = self.sensor_groups.get(variable, [])
+        return self.data_df.select(
+            pl.col(sensor_ids).cast(pl.Float64).fill_null(np.nan)
+        ).to_numpy()
+
+    def mask(self, variable, method='zscore'):
+        """PackedMask of a variable and method, None if the variable has no sensors in the data."""
+        if method not in MASK_FUNCTIONS:
+            raise ValueError(f"Unknown outlier method: {method}. Supported methods are {list(MASK_FUNCTIONS)}.")
+        key = (variable, method)
+        if key not in self._masks:
+            sensor_ids = self.sensor_groups.get(variable, [])
+            if not sensor_ids:
+                return None
+            # All-NaN rows and sensors give warnings only, they never count as outliers
+            with warnings.catch_warnings(), np.errstate(divide='ignore', invalid='ignore'):
+                warnings.simplefilter('ignore', category=RuntimeWarning)
+                mask = MASK_FUNCTIONS[method](self.values(variable), self.datetimes)
+                self._masks[key] = PackedMask(sensor_ids, mask)
+        return self._masks[key]
+
+    def is_outlier(self, variable, sensor_id, method='zscore'):
+        """Boolean array of the outliers of a sensor, None if there is no mask."""
+        mask = self.mask(variable, method)
+        if mask is None or sensor_id not in mask:
+            return None
+        return mask.get(sensor_id)
+
+    def clear(self):
+        """Forget the cached masks, e.g. after the data changed."""
+        self._masks = {}
+        self._datetimes = None
@@ -0,0 +1,59 @@
+import os
+import hashlib
+from datetime import timedelta
+from src.chunk_sink import ParquetChunkSink
+from src.coverage import CoverageIndex, to_utc
+
+# Data younger than this may still be updated in the database, it is only counted as
+# covered up to fetched_at - SETTLE_TIME and fetched again on the next run
+SETTLE_TIME = timedelta(days=1)
+
+class DayPartitionedSink(ParquetChunkSink):
+    """
+    Chunk sink that stores the chunks of one source in a directory per UTC day:
+        <directory>/<YYYY-MM-DD>/chunk_<start>Z_<end>Z[_<tag>].parquet
+    The optional tag tells apart chunks of the same period with different sensors.
+    """
+
+    def __init__(self, directory, tag=None):
+        super().__init__(directory)
+        self.tag = tag
+
+    def chunk_path(self, start_dt, end_dt):
+        """Path of the chunk file, in the directory of the UTC day the chunk starts."""
+        filename = os.path.basename(super().chunk_path(start_dt, end_dt))
+        if self.tag is not None:
+            filename = filename.replace('.parquet', f'_{self.tag}.parquet')
+        return os.path.join(self.directory, to_utc(start_dt).strftime('%Y-%m-%d'), filename)
+
+class PartitionStore:
+    """
+    Date-partitioned Parquet store with a coverage index per source.
+    Downloads only fetch the sensors and periods that are not covered yet,
+    and a requested window is assembled from the local files.
+    """
+
+    def __init__(self, root, settle_time=SETTLE_TIME):
+        self.root = root
+        self.settle_time = settle_time
+        self._coverage = {}
+
+    def sink(self, source, sensorids=None):
+        """Sink for the partitions of a source, tagged with a hash of sensorids if given."""
+        tag = None
+        if sensorids is not None:
+            tag = hashlib.sha256(','.join(sorted(str(sid) for sid in sensorids)).encode()).hexdigest()[:8]
+        return DayPartitionedSink(os.path.join(self.root, source), tag=tag)
+
+    def coverage(self, source):
+        """Coverage index of a source, loaded once per store."""
+        if source not in self._coverage:
+            self._coverage[source] = CoverageIndex(
+                os.path.join(self.root, source, 'coverage.json'),
+                settle_time=self.settle_time
+            )
+        return self._coverage[source]
+
+    def scan(self, source, start_dt=None, end_dt=None):
+        """LazyFrame over the stored data of a source, or None if nothing is stored."""
+        return self.sink(source).scan(start_dt, end_dt)
@@ -1,47 +1,34 @@
 import plotly.graph_objects as go
 import plotly.colors
 import polars as pl
-import pandas as pd
+from src.pyramid import get_trace_data
+from src.cadence import get_cadence_minutes
 print(plotly.__version__)
 
 # for sensor in sensor_names:
-def make_figure(data_df, sensorinfo_df, sensor_groups, sensor, x_range=None, y_range=None):
-    # Handle Polars DataFrames
-    if hasattr(sensorinfo_df, 'to_pandas'):  # It's Polars
-        # Convert to pandas for easier operations
-        sensorinfo_pd = sensorinfo_df.to_pandas()
-        sitenames = sorted(sensorinfo_pd['site_name'].unique())
-    else:
-        # It's already pandas
-        sensorinfo_pd = sensorinfo_df
-        sitenames = sorted(sensorinfo_df['site_name'].unique())
+def make_figure(data_df, sensorinfo_df, sensor_groups, sensor, x_range=None, y_range=None, width=None, pyramid=None):
+    # Metadata lookups straight from Polars, pandas input is converted
+    if not isinstance(sensorinfo_df, pl.DataFrame):
+        sensorinfo_df = pl.from_pandas(sensorinfo_df)
+    sitenames = sorted(sensorinfo_df['site_name'].unique().to_list())
     
     # Assign colors dynamically using Plotly's color sequence
     color_seq = plotly.colors.qualitative.Plotly
     sensor_color_map = {sensor: color_seq[i % len(color_seq)] for i, sensor in enumerate(sitenames)}
 
-    downsample_factor = 30  # Adjust this value to control the downsampling rate
-
-    # Create a mapping from sensor_id to various attributes using pandas
-    sensor_id_to_unit = dict(zip(sensorinfo_pd['sensor_id'], sensorinfo_pd['unit']))
-    sensor_id_to_sensor_name = dict(zip(sensorinfo_pd['sensor_id'], sensorinfo_pd['sensor_name']))
-    sensor_id_to_site_name = dict(zip(sensorinfo_pd['sensor_id'], sensorinfo_pd['site_name']))
-    sensor_id_to_variable_name = dict(zip(sensorinfo_pd['sensor_id'], sensorinfo_pd['variable_name']))
-    sensor_id_to_source = dict(zip(sensorinfo_pd['sensor_id'], sensorinfo_pd['source']))
-    sensor_id_to_longname = dict(zip(sensorinfo_pd['sensor_id'], sensorinfo_pd['long_name']))
-
-    # Handle data_df - convert to pandas for plotting
-    if hasattr(data_df, 'to_pandas'):  # It's Polars
-        data_pd = data_df.to_pandas()
-        if 'datetime' in data_pd.columns:
-            data_pd = data_pd.set_index('datetime')
-    else:
-        # It's already pandas
-        data_pd = data_df
+    # Create a mapping from sensor_id to various attributes
+    sensor_ids_all = sensorinfo_df['sensor_id'].to_list()
+    sensor_id_to_unit = dict(zip(sensor_ids_all, sensorinfo_df['unit'].to_list()))
+    sensor_id_to_sensor_name = dict(zip(sensor_ids_all, sensorinfo_df['sensor_name'].to_list()))
+    sensor_id_to_site_name = dict(zip(sensor_ids_all, sensorinfo_df['site_name'].to_list()))
+    sensor_id_to_variable_name = dict(zip(sensor_ids_all, sensorinfo_df['variable_name'].to_list()))
+    sensor_id_to_source = dict(zip(sensor_ids_all, sensorinfo_df['source'].to_list()))
+    sensor_id_to_longname = dict(zip(sensor_ids_all, sensorinfo_df['long_name'].to_list()))
 
-    # Downsample the data
-    shared_x = data_pd.index[::downsample_factor]
-    data_pd_downsampled = data_pd[::downsample_factor]
+    # Handle data_df - pandas data (indexed by datetime) is converted to Polars
+    if not hasattr(data_df, 'lazy'):
+        data_df = pl.from_pandas(data_df.reset_index())
+    data_columns = set(data_df.columns)
 
     fig = go.Figure()
     
@@ -55,12 +42,20 @@ def make_figure(data_df, sensorinfo_df, sensor_groups, sensor, x_range=None, y_r
         key=lambda sensor_id: sensor_id_to_site_name.get(int(sensor_id) if sensor_id.isdigit() else sensor_id, "")
     )
 
+    # Data of all sensors in the group at once, downsampled to the graph width with the
+    # extremes and gaps of each sensor kept, from the pyramid if one is given.
+    # Gaps are measured in the sampling interval of each sensor from sensorinfo_df
+    traces = get_trace_data(
+        data_df, sensor_ids_str, width=width, pyramid=pyramid,
+        cadences=get_cadence_minutes(sensorinfo_df)
+    )
+
     for sensor_id_str in sensor_ids_str:
         # Convert back to original type for lookup
         sensor_id = int(sensor_id_str) if sensor_id_str.isdigit() else sensor_id_str
         
         # Check if column exists in data
-        if sensor_id_str not in data_pd_downsampled.columns:
+        if sensor_id_str not in data_columns:
             print(f"Warning: Sensor {sensor_id_str} not found in data columns")
             continue
             
@@ -72,12 +67,15 @@ def make_figure(data_df, sensorinfo_df, sensor_groups, sensor, x_range=None, y_r
         long_name = sensor_id_to_longname.get(sensor_id, "")
         source = sensor_id_to_source.get(sensor_id, "")
         
+        # Sensors without data get an empty trace, markers only when every point is shown
+        x, y, full_resolution = traces.get(sensor_id_str, ([], [], True))
+
         # Add trace
         fig.add_trace(
             go.Scattergl(
-                x=shared_x,
-                y=data_pd_downsampled[sensor_id_str],
-                mode='markers+lines',
+                x=x,
+                y=y,
+                mode='markers+lines' if full_resolution else 'lines',
                 name=f"{sitename} ({source}: {sensor_name})",
                 line=dict(width=1, color=sensor_color_map.get(sitename, '#1f77b4')),
                 marker=dict(size=3, color=sensor_color_map.get(sitename, '#1f77b4'))
@@ -0,0 +1,215 @@
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+import polars as pl
+from src.availability_cube import data_time_range
+from src.coverage import to_utc
+from src.downsample import downsample, point_budget
+
+# Aggregation levels of the pyramid, finest first, each built from the previous one.
+# The raw (1-minute) data is the level below the first.
+PYRAMID_LEVELS = {'10m': timedelta(minutes=10), '1h': timedelta(hours=1), '1d': timedelta(days=1)}
+
+PYRAMID_SCHEMA = {
+    'level': pl.Utf8, 'sensor_id': pl.Utf8, 'period': pl.Datetime('us', 'UTC'),
+    'min': pl.Float64, 'mean': pl.Float64, 'max': pl.Float64, 'count': pl.UInt32
+}
+
+def compute_pyramid(data_df):
+    """
+    Multi-resolution summary of data_df (DataFrame, LazyFrame or LazyData): for every level
+    of PYRAMID_LEVELS, one row per sensor and period with min, mean, max and count of the
+    non-null values. The first level is computed from the data in one pass, the coarser
+    levels from the level below. Returns a Polars DataFrame sorted by level, sensor and period.
+    """
+    columns = [col for col in data_df.columns if col != 'datetime']
+    if len(columns) == 0:
+        return pl.DataFrame(schema=PYRAMID_SCHEMA)
+
+    # Finest level: one pass over the wide data, then one row per sensor and period
+    first_level = next(iter(PYRAMID_LEVELS))
+    wide = (
+        data_df.lazy()
+        .sort('datetime')
+        .group_by_dynamic('datetime', every=first_level)
+        .agg(
+            pl.col(columns).cast(pl.Float64).min().name.suffix('|min'),
+            pl.col(columns).cast(pl.Float64).mean().name.suffix('|mean'),
+            pl.col(columns).cast(pl.Float64).max().name.suffix('|max'),
+            pl.col(columns).count().name.suffix('|count'),
+        )
+        .collect()
+    )
+    if wide.height == 0:
+        return pl.DataFrame(schema=PYRAMID_SCHEMA)
+    level_df = (
+        wide.unpivot(index='datetime')
+        .with_columns(pl.col('variable').str.split_exact('|', 1).alias('parts'))
+        .unnest('parts')
+        .rename({'field_0': 'sensor_id', 'field_1': 'stat', 'datetime': 'period'})
+        .pivot(on='stat', index=['sensor_id', 'period'], values='value')
+        .filter(pl.col('count') > 0)
+        .with_columns(pl.lit(first_level).alias('level'))
+        .select(list(PYRAMID_SCHEMA))
+        .cast(PYRAMID_SCHEMA)
+    )
+
+    # Coarser levels from the level below, the mean weighted by the counts
+    levels = [level_df]
+    for level in list(PYRAMID_LEVELS)[1:]:
+        level_df = (
+            level_df.group_by(['sensor_id', pl.col('period').dt.truncate(level)])
+            .agg(
+                pl.col('min').min(),
+                ((pl.col('mean') * pl.col('count')).sum() / pl.col('count').sum()).alias('mean'),
+                pl.col('max').max(),
+                pl.col('count').sum(),
+            )
+            .with_columns(pl.lit(level).alias('level'))
+            .select(list(PYRAMID_SCHEMA))
+            .cast(PYRAMID_SCHEMA)
+        )
+        levels.append(level_df)
+    return pl.concat(levels).sort(['level', 'sensor_id', 'period'], maintain_order=True)
+
+def update_pyramid(pyramid, data_df, start_dt, end_dt, refresh_from=None):
+    """
+    Bring a pyramid up to date for the window start_dt to end_dt, without rescanning data_df.
+    Whole days are kept or recomputed, so the coarser levels stay exact:
+    - days that slid out of the window are dropped,
+    - the first and the last day of the window and of the pyramid (they may be partial),
+      the days that are not in the pyramid yet and the days from refresh_from on (data
+      that may still have changed in the database) are computed from data_df,
+    - sensors that are new in data_df are computed for the days that are kept.
+    """
+    day = list(PYRAMID_LEVELS)[-1]
+    day_step = PYRAMID_LEVELS[day]
+    start_dt, end_dt = to_utc(start_dt), to_utc(end_dt)
+    if pyramid.height == 0:
+        return compute_pyramid(data_time_range(data_df, start_dt, end_dt))
+
+    # Days of the pyramid that are complete, settled and inside the window
+    days = pyramid.filter(pl.col('level') == day)['period']
+    keep_start = max(start_dt.ceil(day_step), days.min() + day_step)
+    keep_end = min(end_dt.floor(day_step), days.max())
+    if refresh_from is not None:
+        keep_end = min(keep_end, to_utc(refresh_from).floor(day_step))
+    if keep_start >= keep_end:
+        return compute_pyramid(data_time_range(data_df, start_dt, end_dt))
+    kept = pyramid.filter((pl.col('period') >= keep_start) & (pl.col('period') < keep_end))
+    before_kept = pd.Timedelta(microseconds=1)
+
+    parts = [
+        kept,
+        compute_pyramid(data_time_range(data_df, start_dt, keep_start - before_kept)),
+        compute_pyramid(data_time_range(data_df, keep_end, end_dt)),
+    ]
+    new_sensors = sorted(set(data_df.columns) - {'datetime'} - set(kept['sensor_id'].unique().to_list()))
+    if new_sensors:
+        parts.append(compute_pyramid(
+            data_time_range(data_df, keep_start, keep_end - before_kept, columns=new_sensors)
+        ))
+    return pl.concat(parts).sort(['level', 'sensor_id', 'period'], maintain_order=True)
+
+def scale_pyramid(pyramid, sensor_ids, factor):
+    """Multiply the values of sensor_ids in the pyramid by factor, like a unit correction of the data."""
+    selected = pl.col('sensor_id').is_in([str(sensor_id) for sensor_id in sensor_ids])
+    # A negative factor swaps min and max
+    low, high = ('max', 'min') if factor < 0 else ('min', 'max')
+    return pyramid.with_columns(
+        pl.when(selected).then(pl.col(low) * factor).otherwise(pl.col('min')).alias('min'),
+        pl.when(selected).then(pl.col('mean') * factor).otherwise(pl.col('mean')).alias('mean'),
+        pl.when(selected).then(pl.col(high) * factor).otherwise(pl.col('max')).alias('max'),
+    )
+
+def select_pyramid_level(start_dt, end_dt, n_points):
+    """
+    Coarsest level of the pyramid that still has enough periods between start_dt and end_dt
+    for n_points (min/max pairs), None if only the raw data is fine enough.
+    """
+    span = to_utc(end_dt) - to_utc(start_dt)
+    for level, step in reversed(PYRAMID_LEVELS.items()):
+        if span / step >= n_points / 2:
+            return level
+    return None
+
+def get_trace_data(data_df, sensor_ids, start_dt=None, end_dt=None, width=None, pyramid=None, cache=None, cadences=None):
+    """
+    Plot data of sensor_ids between start_dt and end_dt (the whole period if None),
+    downsampled to the graph width (see src/downsample.py).
+    With a pyramid the coarsest level that meets the point budget is read, as a min/max
+    envelope, and the raw data is only queried for short windows.
+    With a TraceCache (see src/trace_cache.py) only the sensors that are not cached for
+    this window and resolution are queried.
+    cadences is a dictionary of sensor_id to sampling interval in minutes (see
+    get_cadence_minutes in src/cadence.py), gaps in the raw data are measured in that
+    interval instead of the median distance between the samples in the window.
+    Returns a dictionary of sensor_id to (x, y, full_resolution), full_resolution is True
+    when every sample is shown. Sensors without data in the window are left out.
+    """
+    n_points = point_budget(width)
+    sensor_ids = [str(sensor_id) for sensor_id in dict.fromkeys(sensor_ids)]
+
+    if cache is not None:
+        window = tuple(None if dt is None else str(to_utc(dt)) for dt in (start_dt, end_dt))
+        keys = {sensor_id: (sensor_id, window, n_points) for sensor_id in sensor_ids}
+        # One lookup per sensor, another callback may evict entries in the meantime
+        not_cached = object()
+        cached = {sensor_id: cache.get(keys[sensor_id], not_cached) for sensor_id in sensor_ids}
+        missing = [sensor_id for sensor_id in sensor_ids if cached[sensor_id] is not_cached]
+        traces = get_trace_data(data_df, missing, start_dt, end_dt, width, pyramid, cadences=cadences) if missing else {}
+        for sensor_id in missing:
+            cached[sensor_id] = traces.get(sensor_id)
+            cache.put(keys[sensor_id], cached[sensor_id])
+        return {sensor_id: cached[sensor_id] for sensor_id in sensor_ids if cached[sensor_id] is not None}
+
+    level = None
+    if pyramid is not None and pyramid.height > 0:
+        if start_dt is None or end_dt is None:
+            periods = pyramid.filter(pl.col('level') == next(iter(PYRAMID_LEVELS)))['period']
+            start_dt = periods.min() if start_dt is None else start_dt
+            end_dt = periods.max() if end_dt is None else end_dt
+        if start_dt is not None and end_dt is not None:
+            level = select_pyramid_level(start_dt, end_dt, n_points)
+
+    if level is not None:
+        rows = pyramid.filter(
+            (pl.col('level') == level)
+            & pl.col('sensor_id').is_in(sensor_ids)
+            & (pl.col('period') >= to_utc(start_dt).floor(PYRAMID_LEVELS[level]))
+            & (pl.col('period') <= to_utc(end_dt))
+        )
+        traces = {}
+        half_step = np.timedelta64(PYRAMID_LEVELS[level] // 2)
+        for (sensor_id,), group in rows.group_by(['sensor_id']):
+            group = group.sort('period')
+            # Envelope: the min and the max of every period, at the middle of the period
+            periods = group['period'].dt.replace_time_zone(None).to_numpy() + half_step
+            x = np.repeat(periods, 2)
+            y = np.column_stack([group['min'].to_numpy(), group['max'].to_numpy()]).ravel()
+            # Every period appears twice, the gaps are measured in periods of the level
+            traces[sensor_id] = (*downsample(x, y, n_points, sampling_step=PYRAMID_LEVELS[level]), False)
+        return traces
+
+    # Raw data, only the window and the requested columns are read
+    data_lf = data_df.lazy()
+    if start_dt is not None:
+        data_lf = data_lf.filter(pl.col('datetime') >= to_utc(start_dt).to_pydatetime())
+    if end_dt is not None:
+        data_lf = data_lf.filter(pl.col('datetime') <= to_utc(end_dt).to_pydatetime())
+    data_columns = set(data_df.columns)
+    columns = [sensor_id for sensor_id in sensor_ids if sensor_id in data_columns]
+    window = data_lf.select(['datetime'] + columns).collect()
+    datetimes = window['datetime'].dt.replace_time_zone(None).to_numpy()
+
+    cadences = cadences or {}
+    traces = {}
+    for sensor_id in columns:
+        n_valid = window[sensor_id].count()
+        if n_valid == 0:
+            continue
+        minutes = cadences.get(sensor_id)
+        sampling_step = timedelta(minutes=minutes) if minutes else None
+        x, y = downsample(datetimes, window[sensor_id].cast(pl.Float64).to_numpy(), n_points, sampling_step=sampling_step)
+        traces[sensor_id] = (x, y, n_valid <= n_points)
+    return traces
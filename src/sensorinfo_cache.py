@@ -0,0 +1,31 @@
+import os
+import time
+import polars as pl
+from src.cache_key import hash_check_table
+
+# Time (seconds) a cached sensorinfo file stays valid
+SENSORINFO_CACHE_TTL = 24 * 3600
+
+def get_sensorinfo_cache_file(cache_dir, source, check_table):
+    """Path of the cached sensorinfo for a source and check table."""
+    return os.path.join(cache_dir, f"sensorinfo_{source}_{hash_check_table(check_table)[:16]}.parquet")
+
+def load_cached_sensorinfo(cache_dir, source, check_table, ttl=SENSORINFO_CACHE_TTL):
+    """
+    Load the cached sensorinfo for this source and check table.
+    Returns None if there is no cache file or it is older than ttl seconds.
+    """
+    cache_file = get_sensorinfo_cache_file(cache_dir, source, check_table)
+    if not os.path.exists(cache_file):
+        return None
+    if time.time() - os.path.getmtime(cache_file) > ttl:
+        print(f"Sensorinfo cache expired: {cache_file}")
+        return None
+    print(f"Sensorinfo loaded from cache: {cache_file}")
+    return pl.read_parquet(cache_file)
+
+def save_cached_sensorinfo(cache_dir, source, check_table, sensorinfo_df):
+    """Write the sensorinfo for this source and check table to the cache."""
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_file = get_sensorinfo_cache_file(cache_dir, source, check_table)
+    sensorinfo_df.write_parquet(cache_file)
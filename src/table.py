@@ -1,7 +1,10 @@
+import numpy as np
 import polars as pl
 import matplotlib.colors as mcolors
 from dash import html
 import dash_ag_grid as dag
+from src.availability import compute_sensor_stats
+from src.cadence import get_cadence_minutes
 
 # Function to generate color based on value
 def value_to_color(value):
@@ -66,70 +69,76 @@ def generate_color_rules_and_css():
 
 
 
+# Colour lookup table of the NaN fraction, green (no NaN) over orange to red (all NaN)
+NAN_COLORMAP = mcolors.LinearSegmentedColormap.from_list("nan_gradient", ["#00cc96", "#ffa600", "#ef553b"])
+NAN_COLOR_LUT = np.array([
+    f'rgb({int(r*255)}, {int(g*255)}, {int(b*255)})'
+    for r, g, b, _ in NAN_COLORMAP(np.arange(NAN_COLORMAP.N))
+])
+
+def nan_fraction_to_color(frac_nan):
+    """Vectorised lookup of the colour of NaN fractions (0-1), same bins as the colormap."""
+    idx = (np.clip(np.asarray(frac_nan, dtype=float), 0, 1) * NAN_COLORMAP.N).astype(int)
+    return NAN_COLOR_LUT[np.minimum(idx, NAN_COLORMAP.N - 1)]
+
 def get_cell_values_and_colors(dm, sensorinfo_df, data_df, site_names, var_names):
-    
-    # Helper for color gradient
-    def nan_to_color(frac):
-        cmap = mcolors.LinearSegmentedColormap.from_list(
-            "nan_gradient", ["#00cc96", "#ffa600", "#ef553b"]
-        )
-        frac = min(max(frac, 0), 1)
-        rgb = cmap(frac)[:3]
-        return f'rgb({int(rgb[0]*255)}, {int(rgb[1]*255)}, {int(rgb[2]*255)})'
-
-    # Build cell values and colors
-    cell_values = []
-    cell_colors = []
-    for site in site_names:
-        row_vals = []
-        row_colors = []
-        for var in var_names:
-            # Use Polars filtering
-            sensors = sensorinfo_df.filter(
-                (pl.col('site_name') == site) & (pl.col('variable_name') == var)
-            )['sensor_id'].to_list()
-            
-            if dm.is_check_table_value(site, var):
-                if not sensors:
-                    row_vals.append('A')
-                    row_colors.append("red")
-                    continue
-
-                total = 0
-                nans = 0
-                for sensor in sensors:
-                    sensor_str = str(sensor)
-                    if sensor_str in data_df.columns:
-                        # Convert to pandas temporarily for datetime operations
-                        sensor_data = data_df.select(['datetime', sensor_str]).to_pandas().set_index('datetime')[sensor_str]
-                        
-                        # Detect if this sensor is 30-min data
-                        non_null_data = sensor_data.dropna()
-                        if len(non_null_data) > 0:
-                            is_30min = non_null_data.index.minute.isin([0, 30]).all()
-                            if is_30min:
-                                # Only count expected 30-min intervals
-                                expected = sensor_data.index[(sensor_data.index.minute == 0) | (sensor_data.index.minute == 30)]
-                                total += len(expected)
-                                nans += sensor_data.loc[expected].isna().sum()
-                            else:
-                                total += sensor_data.size
-                                nans += sensor_data.isna().sum()
-                                
-                if total > 0:
-                    frac_nan = nans / total
-                    frac = 1 - frac_nan
-                    row_vals.append(f"{frac:.0%}")
-                    row_colors.append(nan_to_color(frac_nan))
-                else:
-                    row_vals.append('X')
-                    row_colors.append('#f0f0f0')
-            else:
-                row_vals.append('Y')
-                row_colors.append('#f0f0f0')
-        cell_values.append(row_vals)
-        cell_colors.append(row_colors)
-    return cell_values, cell_colors
+    """
+    Availability text and colour per site (rows) and variable (columns).
+    The null counts of all sensors come from one pass over data_df, see src/availability.py.
+    """
+    if dm.check_table is None:
+        dm.load_check_table()
+    check_table = dm.check_table
+
+    # (site, var) combinations that should be checked according to the check_table
+    checked_vars = [var for var in check_table.columns[2:] if var in set(var_names)]
+    checked = check_table[['station'] + checked_vars].melt(id_vars='station', var_name='variable')
+    checked = checked[checked['value'].notna() & (checked['value'] != '')]
+    checked = set(zip(checked['station'], checked['variable']))
+
+    # Precomputed (site, var) -> sensor ids index
+    sensor_index = {}
+    for site, var, sensor in sensorinfo_df.select(['site_name', 'variable_name', 'sensor_id']).iter_rows():
+        sensor_index.setdefault((site, var), []).append(str(sensor))
+
+    # One aggregation for all sensors, counted on the expected timestamps of their cadence
+    stats = compute_sensor_stats(
+        data_df,
+        [sid for sids in sensor_index.values() for sid in sids],
+        cadences=get_cadence_minutes(sensorinfo_df)
+    )
+    # Sensors without data are not counted at all
+    stats = stats.filter(pl.col('n_valid') > 0)
+    sensor_counts = dict(zip(stats['sensor_id'].to_list(), zip(stats['n_slots'].to_list(), stats['n_slot_null'].to_list())))
+
+    # Sum the counts per cell
+    shape = (len(site_names), len(var_names))
+    total = np.zeros(shape)
+    nans = np.zeros(shape)
+    status = np.full(shape, 'Y', dtype=object)
+    for i, site in enumerate(site_names):
+        for j, var in enumerate(var_names):
+            if (site, var) not in checked:
+                continue
+            sensors = sensor_index.get((site, var), [])
+            if not sensors:
+                status[i, j] = 'A'
+                continue
+            status[i, j] = 'X'
+            for sensor in sensors:
+                sensor_total, sensor_nans = sensor_counts.get(sensor, (0, 0))
+                total[i, j] += sensor_total
+                nans[i, j] += sensor_nans
+
+    # Values and colours of all cells at once
+    with np.errstate(divide='ignore', invalid='ignore'):
+        frac_nan = np.where(total > 0, nans / total, 0)
+    has_data = (status == 'X') & (total > 0)
+    values = np.where(has_data, np.char.add(np.round((1 - frac_nan) * 100).astype(int).astype(str), '%'), status)
+    colors = np.where(has_data, nan_fraction_to_color(frac_nan), '#f0f0f0')
+    colors = np.where(status == 'A', 'red', colors)
+
+    return values.tolist(), colors.tolist()
 
 def get_datatable(cell_values, cell_colors, site_names, var_names):
 
@@ -1,9 +1,9 @@
 import plotly.graph_objects as go
 import plotly.express as px
-import polars as pl
 import pandas as pd
-from datetime import datetime
+from dash import Patch
 from dash_bootstrap_templates import template_from_url
+from src.pyramid import get_trace_data
 
 
 def get_plotly_theme(theme_name='light'):
@@ -17,8 +17,8 @@ def get_plotly_theme(theme_name='light'):
         return "plotly_white"
 
 
-def create_timeline_plot(data_df, sensor_id, station, variable, sensor_name, theme='light'):
-    """Create a timeline plot for the selected sensor data"""
+def create_timeline_plot(data_df, sensor_id, station, variable, sensor_name, theme='light', width=None, pyramid=None, cadences=None):
+    """Create a timeline plot for the selected sensor data, downsampled to the graph width"""
     
     # Determine the template based on theme
     template = get_plotly_theme(theme)
@@ -43,13 +43,10 @@ def create_timeline_plot(data_df, sensor_id, station, variable, sensor_name, the
     
     # Extract the sensor data
     try:
-        # Get datetime and sensor columns
-        plot_data = data_df.select(['datetime', sensor_id]).to_pandas()
+        # Datetime and sensor values as NumPy arrays, sensors without data are left out
+        traces = get_trace_data(data_df, [sensor_id], width=width, pyramid=pyramid, cadences=cadences)
         
-        # Remove rows where sensor data is null
-        plot_data = plot_data.dropna(subset=[sensor_id])
-        
-        if plot_data.empty:
+        if sensor_id not in traces:
             # Return empty figure if no data points
             fig = go.Figure()
             fig.add_annotation(
@@ -71,10 +68,11 @@ def create_timeline_plot(data_df, sensor_id, station, variable, sensor_name, the
         # Create the timeline plot
         fig = go.Figure()
         
-        fig.add_trace(go.Scatter(
-            x=plot_data['datetime'],
-            y=plot_data[sensor_id],
-            mode='lines+markers',
+        x, y, full_resolution = traces[sensor_id]
+        fig.add_trace(go.Scattergl(
+            x=x,
+            y=y,
+            mode='lines+markers' if full_resolution else 'lines',
             name=f'{variable}',
             line=dict(width=2),
             marker=dict(size=4),
@@ -132,8 +130,97 @@ def create_timeline_plot(data_df, sensor_id, station, variable, sensor_name, the
         return fig
 
 
-def create_multi_timeline_plot(data_df, selected_cells, check_table, nan_table, theme='light'):
-    """Create a timeline plot showing multiple selected sensors"""
+def resolve_selected_sensors(selected_cells, check_table, nan_table, data_columns):
+    """
+    Sensors of the selected cells that have a column in the data, in selection order and
+    without duplicates: a list of (cell index, station, variable, sensor_id).
+    """
+    # Lookups of the check table row of a station and the sensor_id of a cell, the first one wins
+    station_rows = {}
+    for row, station in enumerate(check_table['station']):
+        station_rows.setdefault(station, row)
+    cell_sensor_ids = {}
+    for key in zip(nan_table['Station'], nan_table['Variable'], nan_table['Sensor_ID']):
+        cell_sensor_ids.setdefault(key[:2], key[2])
+
+    # Track added sensors to avoid duplicates
+    added_sensors = set()
+    selected_sensors = []
+    for i, cell in enumerate(selected_cells):
+        station = cell.get('station', '')
+        variable = cell.get('variable', '')
+        
+        # Skip if we've already added this sensor
+        sensor_key = f"{station}_{variable}"
+        if sensor_key in added_sensors:
+            continue
+        
+        # Find sensor information
+        sensor_name = ''
+        sensor_id = ''
+        try:
+            if station in station_rows and variable in check_table.columns:
+                sensor_name = check_table[variable].iloc[station_rows[station]]
+                if pd.isna(sensor_name):
+                    sensor_name = 'Not assigned'
+                else:
+                    # Find matching sensor_id from nan_table
+                    sensor_id = cell_sensor_ids.get((station, variable), '')
+        except Exception as e:
+            continue  # Skip this sensor if we can't find info
+        
+        # Skip if no valid sensor_id
+        if not sensor_id or sensor_id == '' or sensor_id not in data_columns:
+            continue
+        
+        selected_sensors.append((i, station, variable, sensor_id))
+        added_sensors.add(sensor_key)
+    return selected_sensors
+
+
+def create_timeline_trace(i, station, variable, sensor_id, trace_data):
+    """Trace of one selected sensor, coloured by its position i in the selection."""
+    x, y, full_resolution = trace_data
+    
+    # Color palette for different sensors
+    colors = px.colors.qualitative.Set3
+    color = colors[i % len(colors)]
+    
+    # Markers only when every point is shown
+    return go.Scattergl(
+        x=x,
+        y=y,
+        mode='lines+markers' if full_resolution else 'lines',
+        name=f'{station} - {variable}',
+        meta={'sensor_id': sensor_id, 'cell': f"{station}_{variable}"},  # Used to patch the traces
+        line=dict(width=.5, color=color),
+        marker=dict(size=4, color=color),
+        hovertemplate=f'<b>{station} - {variable}</b><br>' +
+                     'Time: %{x}<br>' +
+                     'Value: %{y}<br>' +
+                     '<extra></extra>'
+    )
+
+
+def get_timeline_x_range(traces):
+    """First and last datetime of the traces, as strings for the axis layout."""
+    x_min = min(x[0] for x, _, _ in traces.values())
+    x_max = max(x[-1] for x, _, _ in traces.values())
+    return [str(x_min), str(x_max)]
+
+
+def get_timeline_title(n_sensors):
+    return f"Multi-Sensor Timeline ({n_sensors} sensors selected)"
+
+
+def create_multi_timeline_plot(data_df, selected_cells, check_table, nan_table, theme='light', width=None, pyramid=None, cache=None, cadences=None):
+    """
+    Create a timeline plot showing multiple selected sensors.
+    Every trace is downsampled to about one point per pixel of the graph width,
+    read from the coarsest fitting level of the pyramid if one is given (see src/pyramid.py)
+    and from the TraceCache if one is given. Gaps in the raw data are measured in the
+    sampling interval of each sensor from cadences (sensor_id to minutes).
+    """
     
     # Determine the template based on theme
     template = get_plotly_theme(theme)
@@ -160,75 +247,22 @@ def create_multi_timeline_plot(data_df, selected_cells, check_table, nan_table,
     # Create the timeline plot
     fig = go.Figure()
     
-    # Color palette for different sensors
-    colors = px.colors.qualitative.Set3
-    
-    # Track added sensors to avoid duplicates
-    added_sensors = set()
-    
     try:
-        for i, cell in enumerate(selected_cells):
-            station = cell.get('station', '')
-            variable = cell.get('variable', '')
-            
-            # Skip if we've already added this sensor
-            sensor_key = f"{station}_{variable}"
-            if sensor_key in added_sensors:
-                continue
-            
-            # Find sensor information
-            sensor_name = ''
-            sensor_id = ''
-            try:
-                station_row = check_table[check_table['station'] == station]
-                if not station_row.empty and variable in station_row.columns:
-                    sensor_name = station_row.iloc[0][variable]
-                    if pd.isna(sensor_name):
-                        sensor_name = 'Not assigned'
-                    else:
-                        # Find matching sensor_id from nan_table
-                        matching_row = nan_table[
-                            (nan_table['Station'] == station) & 
-                            (nan_table['Variable'] == variable)
-                        ]
-                        if not matching_row.empty:
-                            sensor_id = matching_row.iloc[0]['Sensor_ID']
-            except Exception as e:
-                continue  # Skip this sensor if we can't find info
-            
-            # Skip if no valid sensor_id
-            if not sensor_id or sensor_id == '' or sensor_id not in data_df.columns:
-                continue
-            
-            # Extract the sensor data
-            plot_data = data_df.select(['datetime', sensor_id]).to_pandas()
-            plot_data = plot_data.dropna(subset=[sensor_id])
-            
-            if plot_data.empty:
-                continue  # Skip if no data
-            
-            # Add trace for this sensor
-            color = colors[i % len(colors)]
-            
-            fig.add_trace(go.Scatter(
-                x=plot_data['datetime'],
-                y=plot_data[sensor_id],
-                mode='lines+markers',
-                name=f'{station} - {variable}',
-                line=dict(width=.5, color=color),
-                marker=dict(size=4, color=color),
-                hovertemplate=f'<b>{station} - {variable}</b><br>' +
-                             'Time: %{x}<br>' +
-                             'Value: %{y}<br>' +
-                             '<extra></extra>'
-            ))
-            
-            added_sensors.add(sensor_key)
+        selected_sensors = resolve_selected_sensors(selected_cells, check_table, nan_table, set(data_df.columns))
+        
+        # Data of all sensors at once, downsampled with their extremes and gaps kept
+        traces = get_trace_data(
+            data_df, [sensor_id for _, _, _, sensor_id in selected_sensors],
+            width=width, pyramid=pyramid, cache=cache, cadences=cadences
+        )
+        # Skip sensors without data
+        selected_sensors = [sensor for sensor in selected_sensors if sensor[3] in traces]
+        fig.add_traces([create_timeline_trace(*sensor, traces[sensor[3]]) for sensor in selected_sensors])
         
         # Update layout
-        if len(added_sensors) > 0:
+        if len(selected_sensors) > 0:
             fig.update_layout(
-                title=f"Multi-Sensor Timeline ({len(added_sensors)} sensors selected)",
+                title=get_timeline_title(len(selected_sensors)),
                 xaxis_title="Time",
                 yaxis_title="Sensor Values",
                 height=500,
@@ -254,7 +288,8 @@ def create_multi_timeline_plot(data_df, selected_cells, check_table, nan_table,
                             dict(step="all")
                         ])
                     ),
-                    rangeslider=dict(visible=True),
+                    # Fixed to the full period, the traces are replaced by the visible range when zooming
+                    rangeslider=dict(visible=True, range=get_timeline_x_range(traces)),
                     type="date"
                 )
             )
@@ -295,3 +330,94 @@ def create_multi_timeline_plot(data_df, selected_cells, check_table, nan_table,
             template=template
         )
         return fig
+
+
+def get_relayout_x_range(relayout_data):
+    """
+    Visible x-range from the relayoutData of a graph: (start, end) after zooming or panning,
+    (None, None) after resetting the axes, None if the x-axis did not change.
+    """
+    if not relayout_data:
+        return None
+    if relayout_data.get('xaxis.autorange'):
+        return None, None
+    if 'xaxis.range[0]' in relayout_data and 'xaxis.range[1]' in relayout_data:
+        return relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]']
+    if 'xaxis.range' in relayout_data:
+        return tuple(relayout_data['xaxis.range'])
+    return None
+
+
+def patch_multi_timeline_plot(data_df, selected_cells, check_table, nan_table, timeline_state, width=None, pyramid=None, cache=None, cadences=None):
+    """
+    Patch for a multi-sensor timeline when the selection changed by one sensor: only the
+    trace of the added sensor is sent, or the trace of the removed sensor is deleted.
+    timeline_state describes the displayed figure: the 'cells' of its traces and the
+    visible 'x_range' (None for the full period), new traces are made for that range and
+    the range slider is set to the full period of the selected sensors.
+    Returns the patch and the cells and sensor_ids of the new traces, or None when the
+    figure has to be rebuilt.
+    """
+    old_cells = timeline_state.get('cells') or []
+    if not selected_cells or not old_cells:
+        return None
+    selected_sensors = resolve_selected_sensors(selected_cells, check_table, nan_table, set(data_df.columns))
+    x_range = timeline_state.get('x_range') or (None, None)
+    traces = get_trace_data(
+        data_df, [sensor_id for _, _, _, sensor_id in selected_sensors], *x_range,
+        width=width, pyramid=pyramid, cache=cache, cadences=cadences
+    )
+    selected_sensors = [sensor for sensor in selected_sensors if sensor[3] in traces]
+    cells = [f"{station}_{variable}" for _, station, variable, _ in selected_sensors]
+    if not cells:
+        return None
+
+    patched = Patch()
+    if len(cells) == len(old_cells) + 1 and cells[:-1] == old_cells:
+        added = selected_sensors[-1]
+        patched['data'].append(create_timeline_trace(*added, traces[added[3]]).to_plotly_json())
+    elif len(cells) == len(old_cells) - 1:
+        removed = next(i for i, cell in enumerate(cells + [None]) if cell != old_cells[i])
+        if old_cells[:removed] + old_cells[removed + 1:] != cells:
+            return None
+        del patched['data'][removed]
+    elif cells != old_cells:
+        return None
+    patched['layout']['title']['text'] = get_timeline_title(len(cells))
+
+    # The range slider covers the full period of the traces, from the cache when zoomed
+    full_traces = traces
+    if x_range != (None, None):
+        full_traces = get_trace_data(
+            data_df, [sensor_id for _, _, _, sensor_id in selected_sensors],
+            width=width, pyramid=pyramid, cache=cache, cadences=cadences
+        )
+    if full_traces:
+        patched['layout']['xaxis']['rangeslider']['range'] = get_timeline_x_range(full_traces)
+    return patched, cells, [sensor_id for _, _, _, sensor_id in selected_sensors]
+
+
+def resample_timeline_traces(data_df, sensor_ids, start_dt=None, end_dt=None, width=None, pyramid=None, cache=None, cadences=None):
+    """
+    Patch for a multi-sensor timeline with the traces of sensor_ids (in trace order)
+    replaced by the data between start_dt and end_dt, downsampled to the graph width.
+    Only the visible range is queried, from the coarsest fitting level of the pyramid
+    or, for short windows, the raw data, so zooming in far enough shows every sample.
+    The axis range is set as well, so the zoom is kept when the figure updates.
+    """
+    # Axis ranges are strings in UTC, the timezone of the plotted datetimes
+    traces = get_trace_data(data_df, sensor_ids, start_dt, end_dt, width=width, pyramid=pyramid, cache=cache, cadences=cadences)
+
+    patched = Patch()
+    for i, sensor_id in enumerate(sensor_ids):
+        # Sensors without data in the window get an empty trace
+        x, y, full_resolution = traces.get(sensor_id, ([], [], True))
+        patched['data'][i]['x'] = x
+        patched['data'][i]['y'] = y
+        patched['data'][i]['mode'] = 'lines+markers' if full_resolution else 'lines'
+
+    if start_dt is None:
+        patched['layout']['xaxis']['autorange'] = True
+    else:
+        patched['layout']['xaxis']['range'] = [start_dt, end_dt]
+    return patched
@@ -0,0 +1,52 @@
+import threading
+from collections import OrderedDict
+
+# Memory cap of the cached plot data, the least recently used traces are dropped beyond it
+TRACE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+class TraceCache:
+    """
+    Least-recently-used cache of downsampled plot data, (x, y, full_resolution) per key
+    (see get_trace_data in src/pyramid.py), bounded by the memory of the arrays.
+    None is cached as well, for sensors without data in a window.
+    The cache is shared by the Dash callbacks, which run in threads, so access is locked.
+    """
+
+    def __init__(self, max_bytes=TRACE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key, default=None):
+        """Cached value of key, which becomes the most recently used."""
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key, value):
+        """Cache value under key and drop the least recently used entries above the memory cap."""
+        size = 0 if value is None else sum(getattr(array, 'nbytes', 0) for array in value[:2])
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, dropped) = self._entries.popitem(last=False)
+                self.nbytes -= dropped
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0